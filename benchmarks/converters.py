@@ -0,0 +1,92 @@
+"""
+Converter benchmark.
+
+Compares the hand-written `SpecialColor` converter from the sample cog
+against a converter created with `dpybot.converters.lookup_converter()`
+for the same Enum, on valid and invalid arguments.
+
+Example usage:
+
+    python benchmarks/converters.py --iterations 200000 --output converters.json
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+from discord.ext import commands  # noqa: E402
+
+from dpybot.cogs.samplecog.converters import SpecialColor  # noqa: E402
+from dpybot.cogs.samplecog.enums import Color  # noqa: E402
+from dpybot.converters import lookup_converter  # noqa: E402
+
+ARGUMENTS = {
+    "valid": "1",
+    "unknown number": "42",
+    "not a number": "abc",
+}
+
+
+def parse_cli_flags() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--iterations",
+        type=int,
+        default=100000,
+        help="How many times each converter should convert each argument.",
+    )
+    parser.add_argument(
+        "--output", type=Path, help="File that the results should be written to."
+    )
+    return parser.parse_args()
+
+
+async def time_converter(
+    converter: commands.Converter, argument: str, iterations: int
+) -> float:
+    # converters used here don't need the context
+    ctx: Any = None
+    started_at = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            await converter.convert(ctx, argument)
+        except commands.BadArgument:
+            pass
+    return (time.perf_counter() - started_at) / iterations
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    converters = {
+        "SpecialColor": SpecialColor(),
+        "lookup_converter": lookup_converter(Color),
+    }
+    results: Dict[str, Dict[str, float]] = {}
+    for argument_name, argument in ARGUMENTS.items():
+        results[argument_name] = {}
+        for converter_name, converter in converters.items():
+            # warm up the memoization and the interpreter's caches first
+            await time_converter(converter, argument, 1000)
+            per_call = await time_converter(converter, argument, args.iterations)
+            results[argument_name][converter_name] = per_call
+            print(f"{argument_name}, {converter_name}: {per_call * 1e9:.0f} ns/call")
+    return results
+
+
+def main() -> None:
+    args = parse_cli_flags()
+    results = asyncio.run(run_benchmark(args))
+    if args.output is not None:
+        with args.output.open("w", encoding="utf-8") as fp:
+            json.dump(
+                {"iterations": args.iterations, "arguments": results}, fp, indent=4
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+Command dispatch benchmark.
+
+Runs DpyBot against a local fake gateway and HTTP API (see `fake_discord.py`),
+feeds it a synthetic stream of MESSAGE_CREATE and INTERACTION_CREATE events
+and reports throughput and dispatch latency (from the moment the fake gateway
+sent the event to the moment the bot finished handling it) of each workload.
+
+Example usage:
+
+    python benchmarks/dispatch.py --events 2000 --concurrency 20 --output dispatch.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+import discord  # noqa: E402
+from discord.ext import commands  # noqa: E402
+
+from dpybot import config  # noqa: E402
+from dpybot.bot import DpyBot  # noqa: E402
+from fake_discord import FakeDiscord, make_interaction, make_message  # noqa: E402
+
+EventFactory = Callable[[int], Tuple[str, Dict[str, Any]]]
+
+WORKLOADS: Dict[str, EventFactory] = {
+    "non-command message": lambda channel_id: (
+        "MESSAGE_CREATE",
+        make_message(channel_id, "just chatting, not a command"),
+    ),
+    "sendcolor (converter)": lambda channel_id: (
+        "MESSAGE_CREATE",
+        make_message(channel_id, "===sendcolor 1"),
+    ),
+    "sendcolor (bad argument)": lambda channel_id: (
+        "MESSAGE_CREATE",
+        make_message(channel_id, "===sendcolor 42"),
+    ),
+    # `edit` doesn't run when its subcommand is invoked so the leaf command fails
+    # on the attribute `edit` was supposed to set, this measures that error path
+    "groupargs (4-level group)": lambda channel_id: (
+        "MESSAGE_CREATE",
+        make_message(channel_id, "===cogname edit name format opt"),
+    ),
+    "/groupcog command": lambda channel_id: (
+        "INTERACTION_CREATE",
+        make_interaction(channel_id, "groupcog", "command"),
+    ),
+    "/groupcog subgroup2 command": lambda channel_id: (
+        "INTERACTION_CREATE",
+        make_interaction(channel_id, "groupcog", "subgroup2", "command"),
+    ),
+    "/group-with-subgroup subgroup command": lambda channel_id: (
+        "INTERACTION_CREATE",
+        make_interaction(channel_id, "group-with-subgroup", "subgroup", "command"),
+    ),
+    "/group-with-subgroup-subclass subgroup1 command": lambda channel_id: (
+        "INTERACTION_CREATE",
+        make_interaction(
+            channel_id, "group-with-subgroup-subclass", "subgroup1", "command"
+        ),
+    ),
+}
+
+
+def parse_cli_flags() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--events", type=int, default=1000, help="Amount of events per workload."
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=10,
+        help="Maximum amount of events that are being handled at the same time.",
+    )
+    parser.add_argument(
+        "--workload",
+        action="append",
+        choices=list(WORKLOADS),
+        help="Workload to run, can be passed multiple times. Defaults to all.",
+    )
+    parser.add_argument(
+        "--output", type=Path, help="File that the results should be written to."
+    )
+    return parser.parse_args()
+
+
+class DispatchTracker:
+    """Tracks when the bot finishes handling each of the sent events."""
+
+    def __init__(self, bot: DpyBot, fake: FakeDiscord) -> None:
+        self._pending: Dict[str, asyncio.Future] = {}
+        original_process_commands = bot.process_commands
+
+        # messages are done once `process_commands()` returns
+        async def process_commands(message: discord.Message) -> None:
+            await original_process_commands(message)
+            self._done(str(message.id))
+
+        bot.process_commands = process_commands  # type: ignore[assignment]
+
+        # interactions are done once the bot responds to them
+        def on_request(method: str, path: str, body: Dict[str, Any]) -> None:
+            if path.startswith("interactions/") and path.endswith("/callback"):
+                self._done(path.split("/")[1])
+
+        fake.request_callbacks.append(on_request)
+
+    def _done(self, event_id: str) -> None:
+        future = self._pending.pop(event_id, None)
+        if future is not None and not future.done():
+            future.set_result(time.perf_counter())
+
+    def expect(self, event_id: str) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._pending[event_id] = future
+        return future
+
+
+async def run_workload(
+    fake: FakeDiscord,
+    tracker: DispatchTracker,
+    factory: EventFactory,
+    *,
+    events: int,
+    concurrency: int,
+) -> Dict[str, float]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def send_one(idx: int) -> None:
+        async with semaphore:
+            channel_id = fake.channel_ids[idx % len(fake.channel_ids)]
+            event, data = factory(channel_id)
+            future = tracker.expect(data["id"])
+            sent_at = await fake.dispatch(event, data)
+            done_at = await asyncio.wait_for(future, timeout=30)
+            latencies.append(done_at - sent_at)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(send_one(idx) for idx in range(events)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    last = len(latencies) - 1
+    return {
+        "events_per_second": events / elapsed,
+        "p50": latencies[round(last * 0.5)],
+        "p99": latencies[round(last * 0.99)],
+        "max": latencies[last],
+        "mean": statistics.fmean(latencies),
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    fake = FakeDiscord(channel_count=max(args.concurrency, 1))
+    await fake.start()
+    os.environ["DPYBOT_API_BASE"] = fake.api_base
+    os.environ["DPYBOT_GATEWAY_URL"] = fake.gateway_url
+    config.apply_endpoint_overrides()
+
+    bot = DpyBot()
+    tracker = DispatchTracker(bot, fake)
+    bot_task = asyncio.create_task(bot.start("fake-token"))
+    try:
+        ready_task = asyncio.create_task(bot.wait_until_ready())
+        done, _ = await asyncio.wait(
+            {ready_task, bot_task}, timeout=30, return_when=asyncio.FIRST_COMPLETED
+        )
+        if bot_task in done:
+            # propagate the error that stopped the bot before it got ready
+            bot_task.result()
+        if ready_task not in done:
+            ready_task.cancel()
+            raise RuntimeError("The bot did not get ready in 30 seconds.")
+
+        results = {}
+        for name in args.workload or WORKLOADS:
+            factory = WORKLOADS[name]
+            # warm up caches and lazy initialization first
+            await run_workload(
+                fake, tracker, factory, events=args.concurrency, concurrency=1
+            )
+            results[name] = await run_workload(
+                fake,
+                tracker,
+                factory,
+                events=args.events,
+                concurrency=args.concurrency,
+            )
+            result = results[name]
+            print(
+                f"{name}: {result['events_per_second']:.0f} events/s,"
+                f" p50 {result['p50'] * 1000:.2f} ms,"
+                f" p99 {result['p99'] * 1000:.2f} ms"
+            )
+        return results
+    finally:
+        await bot.close()
+        bot_task.cancel()
+        await fake.close()
+
+
+class _GroupArgsErrorFilter(logging.Filter):
+    # the groupargs workload fails on purpose, don't log a traceback for each event
+    def filter(self, record: logging.LogRecord) -> bool:
+        error = record.exc_info[1] if record.exc_info else None
+        return not (
+            isinstance(error, commands.CommandInvokeError)
+            and isinstance(error.original, AttributeError)
+            and error.original.name == "some_special_attrname"
+        )
+
+
+def main() -> None:
+    args = parse_cli_flags()
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("dpybot").addFilter(_GroupArgsErrorFilter())
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(
+            {
+                "DPYBOT_DATA_DIR": data_dir,
+                "DPYBOT_LOAD_ON_STARTUP": "appcommands,samplecog,groupargs",
+                "DPYBOT_PREFIX": "===",
+                "DPYBOT_INTENTS": "default,message_content",
+            }
+        )
+        results = asyncio.run(run_benchmark(args))
+    if args.output is not None:
+        with args.output.open("w", encoding="utf-8") as fp:
+            json.dump(
+                {
+                    "discord.py": discord.__version__,
+                    "events": args.events,
+                    "concurrency": args.concurrency,
+                    "workloads": results,
+                },
+                fp,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
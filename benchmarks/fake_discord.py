@@ -0,0 +1,466 @@
+"""
+Local fake of Discord's gateway and HTTP API.
+
+It implements just enough of both for DpyBot to log in, connect,
+receive a guild and respond to messages and interactions.
+Point the bot at it with `DPYBOT_API_BASE` and `DPYBOT_GATEWAY_URL`
+(see `FakeDiscord.api_base` and `FakeDiscord.gateway_url`).
+"""
+
+import asyncio
+import itertools
+import json
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import WSMsgType, web
+
+BOT_ID = 100000000000000001
+APPLICATION_ID = BOT_ID
+OWNER_ID = 100000000000000002
+USER_ID = 100000000000000003
+GUILD_ID = 100000000000000004
+FIRST_CHANNEL_ID = 100000000000001000
+DISCORD_EPOCH = 1420070400000
+
+_snowflake_increments = itertools.count()
+RequestCallback = Callable[[str, str, Dict[str, Any]], None]
+
+
+def next_snowflake() -> str:
+    # the timestamp matters, e.g. for how old interactions are
+    timestamp = int(time.time() * 1000) - DISCORD_EPOCH
+    return str(timestamp << 22 | next(_snowflake_increments) & 0x3FFFFF)
+
+
+def make_user(user_id: int, name: str, *, bot: bool = False) -> Dict[str, Any]:
+    return {
+        "id": str(user_id),
+        "username": name,
+        "global_name": name,
+        "discriminator": "0",
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def make_member(user: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "user": user,
+        "roles": [],
+        "joined_at": "2020-01-01T00:00:00+00:00",
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def make_guild(channel_count: int) -> Dict[str, Any]:
+    return {
+        "id": str(GUILD_ID),
+        "name": "Benchmark Guild",
+        "icon": None,
+        "owner_id": str(OWNER_ID),
+        "roles": [
+            {
+                "id": str(GUILD_ID),
+                "name": "@everyone",
+                "permissions": str(0xFFFFFFFF),
+                "position": 0,
+                "color": 0,
+                "hoist": False,
+                "managed": False,
+                "mentionable": False,
+            }
+        ],
+        "channels": [
+            {
+                "id": str(FIRST_CHANNEL_ID + idx),
+                "type": 0,
+                "name": f"channel-{idx}",
+                "position": idx,
+                "permission_overwrites": [],
+            }
+            for idx in range(channel_count)
+        ],
+        "members": [
+            make_member(make_user(BOT_ID, "DpyBot", bot=True)),
+            make_member(make_user(OWNER_ID, "owner")),
+            make_member(make_user(USER_ID, "user")),
+        ],
+        "member_count": 3,
+        "emojis": [],
+        "stickers": [],
+        "features": [],
+        "threads": [],
+        "presences": [],
+        "voice_states": [],
+        "stage_instances": [],
+        "guild_scheduled_events": [],
+        "large": False,
+        "unavailable": False,
+        "premium_tier": 0,
+        "verification_level": 0,
+        "default_message_notifications": 0,
+        "explicit_content_filter": 0,
+        "mfa_level": 0,
+        "nsfw_level": 0,
+        "preferred_locale": "en-US",
+    }
+
+
+def make_app_command(command: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": next_snowflake(),
+        "application_id": str(APPLICATION_ID),
+        "version": next_snowflake(),
+        **command,
+    }
+
+
+def make_message(
+    channel_id: int, content: str, *, author_id: int = USER_ID
+) -> Dict[str, Any]:
+    author = make_user(author_id, "user")
+    return {
+        "id": next_snowflake(),
+        "channel_id": str(channel_id),
+        "guild_id": str(GUILD_ID),
+        "author": author,
+        "member": make_member(author),
+        "content": content,
+        "timestamp": "2020-01-01T00:00:00+00:00",
+        "edited_timestamp": None,
+        "tts": False,
+        "mention_everyone": False,
+        "mentions": [],
+        "mention_roles": [],
+        "attachments": [],
+        "embeds": [],
+        "pinned": False,
+        "type": 0,
+    }
+
+
+def make_interaction(
+    channel_id: int, name: str, *options: str, user_id: int = USER_ID
+) -> Dict[str, Any]:
+    """
+    Make a chat input interaction.
+
+    `options` are names of the subcommand group/subcommand that were used,
+    e.g. `make_interaction(channel_id, "groupcog", "subgroup", "command")`.
+    """
+    command_options: List[Dict[str, Any]] = []
+    current = command_options
+    for idx, option in enumerate(options):
+        option_type = 2 if idx < len(options) - 1 else 1
+        nested: List[Dict[str, Any]] = []
+        current.append({"type": option_type, "name": option, "options": nested})
+        current = nested
+    user = make_user(user_id, "user")
+    member = make_member(user)
+    member["permissions"] = str(0xFFFFFFFF)
+    return {
+        "id": next_snowflake(),
+        "application_id": str(APPLICATION_ID),
+        "type": 2,
+        "data": {
+            "id": next_snowflake(),
+            "name": name,
+            "type": 1,
+            "options": command_options,
+        },
+        "guild_id": str(GUILD_ID),
+        "channel_id": str(channel_id),
+        "channel": {"id": str(channel_id), "type": 0, "guild_id": str(GUILD_ID)},
+        "member": member,
+        "token": f"token-{next_snowflake()}",
+        "version": 1,
+        "locale": "en-US",
+        "guild_locale": "en-US",
+        "app_permissions": str(0xFFFFFFFF),
+        "attachment_size_limit": 8 * 1024 * 1024,
+        "entitlements": [],
+        "authorizing_integration_owners": {"0": str(GUILD_ID)},
+        "context": 0,
+    }
+
+
+class FakeDiscord:
+    def __init__(
+        self, *, host: str = "127.0.0.1", port: int = 0, channel_count: int = 50
+    ) -> None:
+        self.host = host
+        self.port = port
+        self.channel_count = channel_count
+        self.channel_ids = [FIRST_CHANNEL_ID + idx for idx in range(channel_count)]
+        self.requests: List[Tuple[str, str]] = []
+        self.request_callbacks: List[RequestCallback] = []
+        # handler returning an optional (status, payload, headers) override
+        # for a request, e.g. to simulate rate limits
+        self.response_override: Optional[
+            Callable[[str, str], Optional[Tuple[int, Any, Dict[str, str]]]]
+        ] = None
+        # (limit, period in seconds) of messages that can be sent to each channel,
+        # exceeding it results in 429 responses like Discord's per-channel rate limit
+        self.message_rate_limit: Optional[Tuple[int, float]] = None
+        self.rate_limited_count = 0
+        # channel path: (window start, messages sent in the window)
+        self._message_windows: Dict[str, Tuple[float, int]] = {}
+        self.sessions: Dict[str, int] = {}
+        self.identify_count = 0
+        self.resume_count = 0
+        self._sockets: List[web.WebSocketResponse] = []
+        # events dispatched while no shard was connected, replayed on resume
+        self._missed_events: List[Tuple[str, Any]] = []
+        self._sequence = 0
+        self._ready = asyncio.Event()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def api_base(self) -> str:
+        return f"http://{self.host}:{self.port}/api/v10"
+
+    @property
+    def gateway_url(self) -> str:
+        return f"ws://{self.host}:{self.port}/gateway"
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get("/gateway", self._handle_gateway)
+        app.router.add_route("*", "/api/v10/{path:.*}", self._handle_api)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = site._server.sockets[0].getsockname()[1]  # type: ignore
+
+    async def close(self) -> None:
+        for ws in list(self._sockets):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def wait_until_ready(self) -> None:
+        await self._ready.wait()
+
+    # HTTP API
+
+    def _route_response(self, method: str, path: str, body: Any) -> Tuple[int, Any]:
+        if path == "users/@me":
+            return 200, make_user(BOT_ID, "DpyBot", bot=True)
+        if path == "oauth2/applications/@me" or path == "applications/@me":
+            return 200, {
+                "id": str(APPLICATION_ID),
+                "name": "DpyBot",
+                "description": "",
+                "icon": None,
+                "bot_public": True,
+                "bot_require_code_grant": False,
+                "owner": make_user(OWNER_ID, "owner"),
+                "verify_key": "",
+                "flags": 0,
+            }
+        if path == "users/@me/guilds":
+            guild = make_guild(self.channel_count)
+            return 200, [{"id": guild["id"], "name": guild["name"], "icon": None}]
+        if path == f"guilds/{GUILD_ID}":
+            guild = make_guild(self.channel_count)
+            for key in ("channels", "members", "threads", "presences", "voice_states"):
+                del guild[key]
+            guild["approximate_member_count"] = guild.pop("member_count")
+            return 200, guild
+        if path == f"guilds/{GUILD_ID}/channels":
+            return 200, make_guild(self.channel_count)["channels"]
+        if path == f"guilds/{GUILD_ID}/members/{BOT_ID}":
+            return 200, make_member(make_user(BOT_ID, "DpyBot", bot=True))
+        if path in ("gateway", "gateway/bot"):
+            return 200, {
+                "url": self.gateway_url,
+                "shards": 1,
+                "session_start_limit": {
+                    "total": 1000,
+                    "remaining": 1000,
+                    "reset_after": 0,
+                    "max_concurrency": 1,
+                },
+            }
+        if path.startswith("applications/") and path.endswith("/commands"):
+            if method == "POST":
+                return 200, make_app_command(body)
+            commands = body if isinstance(body, list) else []
+            return 200, [make_app_command(command) for command in commands]
+        if path.startswith("applications/") and "/commands/" in path:
+            if method == "DELETE":
+                return 204, None
+            return 200, make_app_command({"id": path.rpartition("/")[2], **body})
+        if path.startswith("channels/") and path.endswith("/messages"):
+            channel_id = int(path.split("/")[1])
+            data = make_message(channel_id, body.get("content") or "", author_id=BOT_ID)
+            return 200, data
+        if path.startswith("interactions/"):
+            # interactions/{interaction_id}/{token}/callback?with_response=true
+            return 200, {
+                "interaction": {
+                    "id": path.split("/")[1],
+                    "type": 2,
+                    "response_message_loading": body.get("type") == 5,
+                    "response_message_ephemeral": False,
+                },
+                "resource": {"type": body.get("type", 4)},
+            }
+        if path.startswith("webhooks/"):
+            return 200, make_message(self.channel_ids[0], "", author_id=BOT_ID)
+        return 404, {"message": "404: Not Found", "code": 0}
+
+    def _apply_message_rate_limit(self, path: str) -> Dict[str, str]:
+        assert self.message_rate_limit is not None
+        limit, period = self.message_rate_limit
+        now = time.monotonic()
+        window_start, count = self._message_windows.get(path, (now, 0))
+        if now - window_start >= period:
+            window_start, count = now, 0
+        reset_after = period - (now - window_start)
+        headers = {
+            "X-RateLimit-Limit": str(limit),
+            "X-RateLimit-Bucket": "fake-channel-messages",
+            "X-RateLimit-Reset": str(time.time() + reset_after),
+            "X-RateLimit-Reset-After": f"{reset_after:.3f}",
+        }
+        if count >= limit:
+            headers["X-RateLimit-Remaining"] = "0"
+            headers["X-RateLimit-Scope"] = "user"
+            headers["Retry-After"] = f"{reset_after:.3f}"
+            # discord.py treats 429s without it as a Cloudflare ban
+            headers["Via"] = "1.1 google"
+            return headers
+        self._message_windows[path] = (window_start, count + 1)
+        headers["X-RateLimit-Remaining"] = str(limit - count - 1)
+        return headers
+
+    async def _handle_api(self, request: web.Request) -> web.StreamResponse:
+        path = request.match_info["path"]
+        body: Any = None
+        if request.can_read_body:
+            if request.content_type == "application/json":
+                body = await request.json()
+            elif request.content_type.startswith("multipart/"):
+                form = await request.post()
+                payload_json = form.get("payload_json")
+                body = json.loads(payload_json) if isinstance(payload_json, str) else {}
+        self.requests.append((request.method, path))
+        for callback in self.request_callbacks:
+            callback(request.method, path, body or {})
+
+        headers: Dict[str, str] = {}
+        if (
+            self.message_rate_limit is not None
+            and request.method == "POST"
+            and path.startswith("channels/")
+            and path.endswith("/messages")
+        ):
+            headers = self._apply_message_rate_limit(path)
+            if "Retry-After" in headers:
+                self.rate_limited_count += 1
+                headers["Content-Type"] = "application/json"
+                payload = {
+                    "message": "You are being rate limited.",
+                    "retry_after": float(headers["X-RateLimit-Reset-After"]),
+                    "global": False,
+                }
+                return web.Response(
+                    body=json.dumps(payload).encode(), status=429, headers=headers
+                )
+        override = (
+            self.response_override(request.method, path)
+            if self.response_override is not None
+            else None
+        )
+        if override is not None:
+            status, payload, headers = override
+        else:
+            status, payload = self._route_response(request.method, path, body or {})
+        if status == 204:
+            return web.Response(status=204, headers=headers)
+        # discord.py only decodes responses with this exact content type
+        headers["Content-Type"] = "application/json"
+        return web.Response(
+            body=json.dumps(payload).encode(), status=status, headers=headers
+        )
+
+    # gateway
+
+    async def _handle_gateway(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self._sockets.append(ws)
+        await ws.send_json({"op": 10, "d": {"heartbeat_interval": 41250}})
+        try:
+            async for msg in ws:
+                if msg.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(msg.data)
+                op = payload["op"]
+                if op == 1:
+                    await ws.send_json({"op": 11})
+                elif op == 2:
+                    await self._handle_identify(ws, payload["d"])
+                elif op == 6:
+                    await self._handle_resume(ws, payload["d"])
+        finally:
+            self._sockets.remove(ws)
+        return ws
+
+    async def _send_dispatch(
+        self, ws: web.WebSocketResponse, event: str, data: Any
+    ) -> None:
+        self._sequence += 1
+        await ws.send_json({"op": 0, "t": event, "s": self._sequence, "d": data})
+
+    async def _handle_identify(
+        self, ws: web.WebSocketResponse, data: Dict[str, Any]
+    ) -> None:
+        self.identify_count += 1
+        session_id = f"session-{next_snowflake()}"
+        self.sessions[session_id] = 0
+        await self._send_dispatch(
+            ws,
+            "READY",
+            {
+                "v": 10,
+                "user": make_user(BOT_ID, "DpyBot", bot=True),
+                "guilds": [{"id": str(GUILD_ID), "unavailable": True}],
+                "session_id": session_id,
+                "resume_gateway_url": self.gateway_url,
+                "shard": data.get("shard", [0, 1]),
+                "application": {"id": str(APPLICATION_ID), "flags": 0},
+            },
+        )
+        await self._send_dispatch(ws, "GUILD_CREATE", make_guild(self.channel_count))
+        self._ready.set()
+
+    async def _handle_resume(
+        self, ws: web.WebSocketResponse, data: Dict[str, Any]
+    ) -> None:
+        if data.get("session_id") not in self.sessions:
+            # invalid session, not resumable
+            await ws.send_json({"op": 9, "d": False})
+            return
+        self.resume_count += 1
+        # like Discord, missed events are replayed before RESUMED
+        for event, event_data in self._missed_events:
+            await self._send_dispatch(ws, event, event_data)
+        self._missed_events.clear()
+        await self._send_dispatch(ws, "RESUMED", {})
+        self._ready.set()
+
+    async def dispatch(self, event: str, data: Any) -> float:
+        """Send a dispatch event to all connected shards and return the send time."""
+        sent_at = time.perf_counter()
+        if not self._sockets:
+            self._missed_events.append((event, data))
+        for ws in self._sockets:
+            await self._send_dispatch(ws, event, data)
+        return sent_at
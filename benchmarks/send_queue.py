@@ -0,0 +1,156 @@
+"""
+Outbound message queue benchmark.
+
+Runs DpyBot against a local fake gateway and HTTP API (see `fake_discord.py`)
+that rate limits messages sent to each channel like Discord does, sends
+a burst of small messages to a few channels directly with `channel.send()`
+and through `DpyBot.send_queue` with coalescing, and reports how long
+each burst took, how many requests it made and how many 429s it got.
+
+Example usage:
+
+    python benchmarks/send_queue.py --messages 50 --channels 3
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict
+
+sys.path.insert(0, str(Path(__file__).absolute().parent.parent))
+
+import discord  # noqa: E402
+
+from dpybot import config  # noqa: E402
+from dpybot.bot import DpyBot  # noqa: E402
+from dpybot.send_queue import Priority  # noqa: E402
+from fake_discord import FakeDiscord  # noqa: E402
+
+SendFunc = Callable[[discord.TextChannel, str], Awaitable[Any]]
+
+
+def parse_cli_flags() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--messages",
+        type=int,
+        default=50,
+        help="Amount of messages sent to each channel in a burst.",
+    )
+    parser.add_argument(
+        "--channels", type=int, default=3, help="Amount of channels to send to."
+    )
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=5,
+        help="Amount of messages per second the fake API allows in each channel.",
+    )
+    parser.add_argument(
+        "--output", type=Path, help="File that the results should be written to."
+    )
+    return parser.parse_args()
+
+
+async def run_burst(
+    fake: FakeDiscord, bot: DpyBot, send: SendFunc, args: argparse.Namespace
+) -> Dict[str, float]:
+    channels = [bot.get_channel(channel_id) for channel_id in fake.channel_ids]
+    requests_before = len(fake.requests)
+    rate_limited_before = fake.rate_limited_count
+    started_at = time.perf_counter()
+    await asyncio.gather(
+        *(
+            send(channel, f"message {idx}")  # type: ignore[arg-type]
+            for idx in range(args.messages)
+            for channel in channels
+        )
+    )
+    return {
+        "duration": time.perf_counter() - started_at,
+        "requests": len(fake.requests) - requests_before,
+        "rate_limited": fake.rate_limited_count - rate_limited_before,
+    }
+
+
+async def run_benchmark(args: argparse.Namespace) -> Dict[str, Dict[str, float]]:
+    fake = FakeDiscord(channel_count=args.channels)
+    await fake.start()
+    os.environ["DPYBOT_API_BASE"] = fake.api_base
+    os.environ["DPYBOT_GATEWAY_URL"] = fake.gateway_url
+    config.apply_endpoint_overrides()
+
+    bot = DpyBot()
+    bot_task = asyncio.create_task(bot.start("fake-token"))
+    try:
+        ready_task = asyncio.create_task(bot.wait_until_ready())
+        done, _ = await asyncio.wait(
+            {ready_task, bot_task}, timeout=30, return_when=asyncio.FIRST_COMPLETED
+        )
+        if bot_task in done:
+            # propagate the error that stopped the bot before it got ready
+            bot_task.result()
+        if ready_task not in done:
+            ready_task.cancel()
+            raise RuntimeError("The bot did not get ready in 30 seconds.")
+
+        async def send_directly(channel: discord.TextChannel, content: str) -> Any:
+            return await channel.send(content)
+
+        async def send_queued(channel: discord.TextChannel, content: str) -> Any:
+            return await bot.send_queue.send(
+                channel, content, coalesce=True, priority=Priority.BULK
+            )
+
+        results = {}
+        for name, send in (("direct", send_directly), ("queued", send_queued)):
+            fake.message_rate_limit = (args.rate_limit, 1.0)
+            # start each burst with a fresh rate limit window
+            await asyncio.sleep(1.0)
+            results[name] = result = await run_burst(fake, bot, send, args)
+            print(
+                f"{name}: {result['duration']:.2f} s,"
+                f" {result['requests']:.0f} requests,"
+                f" {result['rate_limited']:.0f} rate limited"
+            )
+        return results
+    finally:
+        await bot.close()
+        bot_task.cancel()
+        await fake.close()
+
+
+def main() -> None:
+    args = parse_cli_flags()
+    logging.basicConfig(level=logging.ERROR)
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(
+            {
+                "DPYBOT_DATA_DIR": data_dir,
+                "DPYBOT_LOAD_ON_STARTUP": "",
+                "DPYBOT_PREFIX": "===",
+            }
+        )
+        results = asyncio.run(run_benchmark(args))
+    if args.output is not None:
+        with args.output.open("w", encoding="utf-8") as fp:
+            json.dump(
+                {
+                    "messages": args.messages,
+                    "channels": args.channels,
+                    "rate_limit": args.rate_limit,
+                    "bursts": results,
+                },
+                fp,
+                indent=4,
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Startup benchmark.
+
+Runs `python -m dpybot --profile-startup` a few times with all cogs
+from `dpybot/cogs` loaded, writes the median timings to a JSON file
+and optionally compares them against a baseline file, exiting with
+a non-zero exit code when any of the timings regressed.
+
+Example usage in CI:
+
+    python benchmarks/startup.py --output startup.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+ROOT_FOLDER = Path(__file__).absolute().parent.parent
+COGS_FOLDER = ROOT_FOLDER / "dpybot" / "cogs"
+METRICS = (
+    "import_time",
+    "bot_init_time",
+    "setup_hook_time",
+    "cog_load_time",
+    "tree_construction_time",
+)
+
+
+def parse_cli_flags() -> argparse.Namespace:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--env-name",
+        default="example",
+        help="Name of the environment file that the bot should load.",
+    )
+    parser.add_argument(
+        "--runs", type=int, default=5, help="How many times to run the profile."
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("startup_benchmark.json"),
+        help="File that the results should be written to.",
+    )
+    parser.add_argument(
+        "--baseline",
+        type=Path,
+        help="File with results of an earlier run to compare against.",
+    )
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.25,
+        help="Maximum allowed relative slowdown of a metric (0.25 = 25%%).",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=0.005,
+        help=(
+            "Minimum absolute slowdown (in seconds) for a metric to be considered"
+            " a regression, used to ignore noise in very short timings."
+        ),
+    )
+    return parser.parse_args()
+
+
+def get_cog_names() -> List[str]:
+    return sorted(
+        path.name for path in COGS_FOLDER.iterdir() if (path / "__init__.py").is_file()
+    )
+
+
+def run_profile(env_name: str, cog_names: List[str]) -> Dict[str, Any]:
+    env = os.environ.copy()
+    env["DPYBOT_LOAD_ON_STARTUP"] = ",".join(cog_names)
+    with tempfile.TemporaryDirectory() as output_dir:
+        proc = subprocess.run(
+            (
+                sys.executable,
+                "-m",
+                "dpybot",
+                env_name,
+                "--profile-startup",
+                "--profile-output",
+                output_dir,
+            ),
+            cwd=ROOT_FOLDER,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode:
+            print(proc.stderr, file=sys.stderr)
+            proc.check_returncode()
+        with open(Path(output_dir) / "report.json", encoding="utf-8") as fp:
+            return json.load(fp)
+
+
+def main() -> int:
+    args = parse_cli_flags()
+    cog_names = get_cog_names()
+    reports = [run_profile(args.env_name, cog_names) for _ in range(args.runs)]
+    results: Dict[str, Any] = {
+        "cogs": cog_names,
+        "runs": args.runs,
+        "metrics": {
+            metric: statistics.median(report[metric] for report in reports)
+            for metric in METRICS
+        },
+        "packages": {
+            package["name"]: statistics.median(
+                report_package["import_time"] + report_package["setup_time"]
+                for report in reports
+                for report_package in report["packages"]
+                if report_package["name"] == package["name"]
+            )
+            for package in reports[0]["packages"]
+        },
+    }
+    with args.output.open("w", encoding="utf-8") as fp:
+        json.dump(results, fp, indent=4)
+
+    for metric, value in results["metrics"].items():
+        print(f"{metric}: {value * 1000:.1f} ms")
+
+    if args.baseline is None:
+        return 0
+
+    with args.baseline.open(encoding="utf-8") as fp:
+        baseline = json.load(fp)
+
+    regressed = False
+    comparisons = [
+        (metric, baseline["metrics"].get(metric), value)
+        for metric, value in results["metrics"].items()
+    ]
+    comparisons.extend(
+        (f"package {name}", baseline["packages"].get(name), value)
+        for name, value in results["packages"].items()
+    )
+    for name, old, new in comparisons:
+        if old is None:
+            print(f"{name}: new ({new * 1000:.1f} ms)")
+            continue
+        if new - old > args.min_delta and new > old * (1 + args.max_regression):
+            regressed = True
+            print(
+                f"REGRESSION: {name} went from {old * 1000:.1f} ms"
+                f" to {new * 1000:.1f} ms"
+            )
+    return 1 if regressed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,13 +1,22 @@
 import argparse
 import asyncio
+import atexit
 import logging
+import logging.handlers
 import os
+import queue
 import warnings
+from pathlib import Path
+from typing import List, Optional
 
 import discord
 from dotenv import load_dotenv
 
+from dpybot import config, log
 from dpybot.bot import DpyBot
+from dpybot.cluster import IdentifyThrottle, run_clusters
+from dpybot.log_handlers import DroppingQueueHandler, JsonFormatter
+from dpybot.startup_profile import run_startup_profile
 
 warnings.filterwarnings("default", category=DeprecationWarning)
 
@@ -35,24 +44,131 @@ def parse_cli_flags() -> argparse.Namespace:
     parser.add_argument(
         "--debug", action="store_true", help="Set the logger's level to debug."
     )
+    parser.add_argument(
+        "--force-sync",
+        action="store_true",
+        help=(
+            "Sync the app command tree on startup"
+            " even if it didn't change since the last sync."
+        ),
+    )
+    parser.add_argument(
+        "--uvloop",
+        action="store_true",
+        default=None,
+        help="Use uvloop's event loop instead of the default asyncio one.",
+    )
+    parser.add_argument(
+        "--clusters",
+        type=int,
+        default=None,
+        help=(
+            "Split the shards into the given amount of clusters"
+            " and run each of them in a separate process."
+        ),
+    )
+    parser.add_argument(
+        "--profile-startup",
+        action="store_true",
+        help=(
+            "Instead of running the bot, profile its startup without connecting"
+            " to Discord and write a report to the `--profile-output` directory."
+        ),
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=Path,
+        default=Path("startup_profile"),
+        help="Directory that the startup profile should be written to.",
+    )
+    parser.add_argument(
+        "--profile-artifacts",
+        action="store_true",
+        help=(
+            "Also save cProfile stats (`startup.prof`)"
+            " and `-X importtime` output (`importtime.txt`) of the startup."
+        ),
+    )
     return parser.parse_args()
 
 
-def setup_logging(debug: bool = False) -> None:
-    info_file_handler = logging.FileHandler("info.log", encoding="utf-8")
-    debug_file_handler = logging.FileHandler("debug.log", mode="w", encoding="utf-8")
+def _make_file_handler(file_name: str, *, truncate: bool = False) -> logging.Handler:
+    rotation = config.get_str("DPYBOT_LOG_ROTATION", "size").lower()
+    backup_count = config.get_int("DPYBOT_LOG_BACKUP_COUNT", 5)
+    handler: logging.FileHandler
+    if rotation == "size":
+        handler = logging.handlers.RotatingFileHandler(
+            file_name,
+            maxBytes=config.get_int("DPYBOT_LOG_MAX_BYTES", 10 * 1024**2),
+            backupCount=backup_count,
+            encoding="utf-8",
+        )
+    elif rotation == "time":
+        handler = logging.handlers.TimedRotatingFileHandler(
+            file_name,
+            when=config.get_str("DPYBOT_LOG_ROTATE_WHEN", "midnight"),
+            backupCount=backup_count,
+            encoding="utf-8",
+        )
+    elif rotation == "none":
+        return logging.FileHandler(
+            file_name, mode="w" if truncate else "a", encoding="utf-8"
+        )
+    else:
+        raise ValueError(
+            "DPYBOT_LOG_ROTATION needs to be one of: size, time, none."
+            f" Got {rotation!r}"
+        )
+
+    # start with a fresh file but keep the previous run's logs as a backup
+    if truncate and os.path.getsize(file_name):
+        handler.doRollover()
+    return handler
+
+
+def setup_logging(
+    debug: bool = False, *, cluster_id: Optional[int] = None
+) -> DroppingQueueHandler:
+    suffix = "" if cluster_id is None else f".cluster{cluster_id}"
+    info_file_handler = _make_file_handler(f"info{suffix}.log")
+    debug_file_handler = _make_file_handler(f"debug{suffix}.log", truncate=True)
     stdout_handler = logging.StreamHandler()
 
     info_file_handler.setLevel(logging.INFO)
     if not debug:
         stdout_handler.setLevel(logging.INFO)
 
-    logging.basicConfig(
-        format="[%(asctime)s] [%(levelname)s] %(name)s: %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S",
-        level=logging.DEBUG,
-        handlers=[stdout_handler, info_file_handler, debug_file_handler],
+    log_format = "[%(asctime)s] [%(levelname)s] %(name)s: %(message)s"
+    if cluster_id is not None:
+        log_format = f"[cluster {cluster_id}] {log_format}"
+    text_formatter = logging.Formatter(log_format, datefmt="%Y-%m-%d %H:%M:%S")
+    file_formatter: logging.Formatter = text_formatter
+    if config.get_str("DPYBOT_LOG_FORMAT", "text").lower() == "json":
+        file_formatter = JsonFormatter()
+    stdout_handler.setFormatter(text_formatter)
+    info_file_handler.setFormatter(file_formatter)
+    debug_file_handler.setFormatter(file_formatter)
+
+    # All handlers run on the listener's thread so that disk I/O
+    # never blocks the event loop.
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(
+        config.get_int("DPYBOT_LOG_QUEUE_SIZE", 10000) or 0
     )
+    queue_handler = DroppingQueueHandler(log_queue)
+    listener = logging.handlers.QueueListener(
+        log_queue,
+        stdout_handler,
+        info_file_handler,
+        debug_file_handler,
+        respect_handler_level=True,
+    )
+    listener.start()
+    atexit.register(listener.stop)
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(logging.DEBUG)
+    root_logger.addHandler(queue_handler)
+    return queue_handler
 
 
 def _cancel_all_tasks(loop: asyncio.AbstractEventLoop) -> None:
@@ -78,10 +194,36 @@ def _cancel_all_tasks(loop: asyncio.AbstractEventLoop) -> None:
             )
 
 
-def run_bot() -> None:
+def _new_event_loop(use_uvloop: bool) -> asyncio.AbstractEventLoop:
+    if use_uvloop:
+        try:
+            import uvloop
+        except ImportError:
+            log.warning("uvloop is not installed, falling back to asyncio's loop.")
+        else:
+            return uvloop.new_event_loop()
+    return asyncio.new_event_loop()
+
+
+def run_bot(
+    *,
+    force_sync: bool = False,
+    sync_on_startup: bool = True,
+    use_uvloop: bool = False,
+    shard_ids: Optional[List[int]] = None,
+    shard_count: Optional[int] = None,
+    identify_throttle: Optional[IdentifyThrottle] = None,
+) -> None:
     TOKEN = os.environ["DPYBOT_TOKEN"]
-    loop = asyncio.new_event_loop()
-    bot = DpyBot()
+    config.apply_endpoint_overrides()
+    loop = _new_event_loop(use_uvloop)
+    bot = DpyBot(
+        force_sync=force_sync,
+        sync_on_startup=sync_on_startup,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        identify_throttle=identify_throttle,
+    )
     try:
         loop.run_until_complete(bot.start(TOKEN))
     except KeyboardInterrupt:
@@ -96,7 +238,6 @@ def run_bot() -> None:
         try:
             loop.run_until_complete(bot.close())
             _cancel_all_tasks(loop)
-            loop.run_until_complete(asyncio.sleep(2))
             loop.run_until_complete(loop.shutdown_asyncgens())
         finally:
             asyncio.set_event_loop(None)
@@ -108,7 +249,26 @@ def main() -> None:
     args = parse_cli_flags()
     load_dotenv(args.env_name)
     setup_logging(args.debug)
-    run_bot()
+    if args.profile_startup:
+        run_startup_profile(args.profile_output, save_artifacts=args.profile_artifacts)
+        return
+    use_uvloop = args.uvloop
+    if use_uvloop is None:
+        use_uvloop = config.get_bool("DPYBOT_USE_UVLOOP", False)
+    cluster_count = args.clusters
+    if cluster_count is None:
+        cluster_count = config.get_int("DPYBOT_CLUSTER_COUNT", 0)
+    if cluster_count:
+        run_clusters(
+            cluster_count,
+            {
+                "debug": args.debug,
+                "force_sync": args.force_sync,
+                "use_uvloop": use_uvloop,
+            },
+        )
+        return
+    run_bot(force_sync=args.force_sync, use_uvloop=use_uvloop)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import contextlib
+from typing import TYPE_CHECKING, Any, Optional
+
+import discord
+
+from dpybot.send_queue import Priority
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+
+class AutoDeferResponse(discord.InteractionResponse["DpyBot"]):
+    """
+    Interaction response that can be deferred automatically.
+
+    Once the response was deferred by `auto_defer()`, `send_message()` sends
+    a followup instead (returning the sent `WebhookMessage`) and `defer()` does nothing
+    so that the command's callback doesn't need to know whether it happened.
+
+    The first followup replaces the "thinking" message and gets its visibility,
+    so when the response's `ephemeral` doesn't match the deferral's, the "thinking"
+    message is deleted first and the followup is sent as a new message instead.
+
+    Responses hold a send slot of the bot's send queue with interaction priority,
+    so they skip ahead of queued command responses and bulk sends.
+    """
+
+    __slots__ = ("_lock", "auto_deferred", "_deferred_ephemeral", "_replaced")
+
+    def __init__(self, parent: discord.Interaction[DpyBot]) -> None:
+        super().__init__(parent)
+        # makes sure the automatic deferral doesn't race with the callback's response
+        self._lock = asyncio.Lock()
+        self.auto_deferred = False
+        self._deferred_ephemeral = False
+        # whether the "thinking" message was already replaced by a followup
+        self._replaced = False
+
+    def _slot(self) -> contextlib.AbstractAsyncContextManager:
+        return self._parent.client.send_queue.slot(Priority.INTERACTION)
+
+    async def auto_defer(self, *, ephemeral: bool = False) -> bool:
+        async with self._slot(), self._lock:
+            if self.is_done():
+                return False
+            await super().defer(ephemeral=ephemeral, thinking=True)
+            self.auto_deferred = True
+            self._deferred_ephemeral = ephemeral
+            return True
+
+    async def defer(self, **kwargs: Any) -> Any:
+        async with self._slot(), self._lock:
+            if self.auto_deferred:
+                return None
+            return await super().defer(**kwargs)
+
+    async def send_message(self, content: Optional[Any] = None, **kwargs: Any) -> Any:
+        async with self._slot():
+            async with self._lock:
+                if not self.auto_deferred:
+                    return await super().send_message(content, **kwargs)
+                if not self._replaced:
+                    self._replaced = True
+                    if kwargs.get("ephemeral", False) != self._deferred_ephemeral:
+                        await self._parent.delete_original_response()
+
+            delete_after = kwargs.pop("delete_after", None)
+            if content is not None:
+                kwargs["content"] = content
+            message = await self._parent.followup.send(wait=True, **kwargs)
+        if delete_after is not None:
+            await message.delete(delay=delete_after)
+        return message
+
+    async def edit_message(self, **kwargs: Any) -> Any:
+        async with self._slot():
+            return await super().edit_message(**kwargs)
+
+    async def send_modal(self, modal: discord.ui.Modal, /) -> Any:
+        async with self._slot():
+            return await super().send_modal(modal)
@@ -1,57 +1,448 @@
-import os
+from __future__ import annotations
+
+import asyncio
+import importlib.util
+import time
+from types import ModuleType
+from typing import TYPE_CHECKING, Any, List, Optional, Set, Union
 
 import discord
+import yarl
+from discord import app_commands
 from discord.ext import commands
+from discord.shard import Shard
 
-from dpybot import log
+from dpybot import config, log
+from dpybot.checks import CHECK_CACHE, CheckCacheInvalidator, instrument_command
+from dpybot.command_profiler import CommandProfiler
+from dpybot.context import DpyContext
 from dpybot.core_commands import Core
+from dpybot.gateway_sessions import (
+    GatewaySession,
+    SessionStore,
+    restore_guilds,
+    supports_resume,
+)
+from dpybot.help import DpyHelpCommand, HelpCache
+from dpybot.hot_reload import HotReloader
+from dpybot.intents import (
+    estimate_cache_footprint,
+    format_flags,
+    get_cache_options,
+    get_required_intents,
+)
+from dpybot.invocations import InvocationTracker
+from dpybot.loop_monitor import LoopLagMonitor
+from dpybot.metrics import Metrics
+from dpybot.package_loader import (
+    PackageLoadResult,
+    format_load_results,
+    load_packages,
+)
+from dpybot.prefixes import PrefixManager
+from dpybot.send_queue import SendQueue
+from dpybot.tree import DpyTree
+from dpybot.tree_sync import sync_tree
+
+if TYPE_CHECKING:
+    from dpybot.cluster import IdentifyThrottle
 
 
 class DpyBot(commands.AutoShardedBot):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        *,
+        force_sync: bool = False,
+        sync_on_startup: bool = True,
+        shard_ids: Optional[List[int]] = None,
+        shard_count: Optional[int] = None,
+        identify_throttle: Optional[IdentifyThrottle] = None,
+    ) -> None:
+        cache_options = get_cache_options()
+        self.prefix_manager = PrefixManager.from_env()
+        # commands (e.g. the help command) can already be added during `__init__()`
+        self.metrics: Optional[Metrics] = None
+        self.send_queue = SendQueue.from_env()
+        self.help_cache = HelpCache()
         super().__init__(
-            command_prefix=commands.when_mentioned_or(
-                os.getenv("DPYBOT_PREFIX", "===")
-            ),
-            intents=discord.Intents.all(),
+            command_prefix=self.prefix_manager,
+            shard_ids=shard_ids,
+            shard_count=shard_count,
+            tree_cls=DpyTree,
+            help_command=DpyHelpCommand(),
+            http_trace=self.send_queue.create_trace_config(),
+            **cache_options,
         )
+        self.identify_throttle = identify_throttle
+        # limits help sent in response to command errors to prevent spam
+        self._error_help_cooldown = commands.CooldownMapping.from_cooldown(
+            config.get_int("DPYBOT_ERROR_HELP_RATE", 2),
+            config.get_float("DPYBOT_ERROR_HELP_PER", 30.0),
+            commands.BucketType.user,
+        )
+        self._explicit_member_cache_flags = "member_cache_flags" in cache_options
+        self._explicit_chunk_guilds = "chunk_guilds_at_startup" in cache_options
+        self._intents_locked = False
+        self.force_sync = force_sync
+        self.sync_on_startup = sync_on_startup
+        self.package_load_results: List[PackageLoadResult] = []
+        self.loop_monitor = LoopLagMonitor.from_env()
+        self.command_profiler = CommandProfiler()
+        self.hot_reloader = HotReloader.from_env(self)
+        self.session_store = SessionStore.from_env()
+        self.invocations = InvocationTracker()
+        # how long (in seconds) the in-flight invocations can take to finish on close
+        self.drain_timeout = config.get_float("DPYBOT_DRAIN_TIMEOUT", 10.0)
+        # shards that resumed a session saved by a previous process
+        self._resumed_shards: Set[int] = set()
+        self._metrics_address = Metrics.get_server_address()
+        if self._metrics_address is not None:
+            self.metrics = Metrics(self)
+            self.metrics.add_metric(CHECK_CACHE.requests)
+            self.metrics.add_metric(self.tree.auto_defers)
+            self.metrics.add_metric(self.send_queue.rate_limited)
+            self.metrics.add_metric(self.send_queue.coalesced)
+            self.metrics.add_metric(self.send_queue.queue_depth)
+            self.before_invoke(self._record_prepare_time)
+            self.tree.error(self._on_app_command_error)
 
     async def setup_hook(self) -> None:
-        LOAD_ON_STARTUP = os.getenv("DPYBOT_LOAD_ON_STARTUP", "").split(",")
+        if self.loop_monitor is not None:
+            self.loop_monitor.start()
+        if self.metrics is not None and self._metrics_address is not None:
+            await self.metrics.start_server(*self._metrics_address)
+        LOAD_ON_STARTUP = config.get_list("DPYBOT_LOAD_ON_STARTUP")
         await self.add_cog(Core(self))
-        for pkg_name in LOAD_ON_STARTUP:
-            await self.load_package(pkg_name)
-        await self.tree.sync()
+        await self.add_cog(CheckCacheInvalidator(self))
+        self.package_load_results = await load_packages(self, LOAD_ON_STARTUP)
+        log.info(
+            "Packages loaded on startup:\n%s",
+            format_load_results(self.package_load_results),
+        )
+        if self.sync_on_startup:
+            await sync_tree(self, force=self.force_sync)
+        self._intents_locked = True
+        self._log_cache_config()
+        if self.hot_reloader is not None:
+            self.hot_reloader.start()
+
+    async def before_identify_hook(
+        self, shard_id: Optional[int], *, initial: bool = False
+    ) -> None:
+        if self.identify_throttle is None or shard_id is None:
+            await super().before_identify_hook(shard_id, initial=initial)
+            return
+        await self.identify_throttle.wait(shard_id)
+
+    async def launch_shard(
+        self, gateway: yarl.URL, shard_id: int, *, initial: bool = False
+    ) -> None:
+        if self.session_store is not None and not supports_resume(self):
+            log.warning(
+                "Gateway sessions can't be resumed with this version of discord.py,"
+                " shards will identify instead."
+            )
+            self.session_store = None
+        session = None
+        if self.session_store is not None and self.shard_count is not None:
+            session = self.session_store.pop(shard_id, self.shard_count)
+        if session is None:
+            await super().launch_shard(gateway, shard_id, initial=initial)
+            return
+
+        if not await self._restore_shard(session):
+            await super().launch_shard(gateway, shard_id, initial=initial)
+            return
+        try:
+            ws = await asyncio.wait_for(
+                session.connect(self), timeout=self.shard_connect_timeout
+            )
+        except Exception:
+            log.warning(
+                "Failed to resume the session of shard ID %s, identifying instead.",
+                shard_id,
+                exc_info=True,
+            )
+            await super().launch_shard(gateway, shard_id, initial=initial)
+            return
+        # the private attributes used here are checked by `supports_resume()`
+        try:
+            shard = Shard(ws, self, self._AutoShardedClient__queue.put_nowait)
+        except TypeError:
+            log.warning(
+                "Failed to launch the resumed shard ID %s, identifying instead.",
+                shard_id,
+                exc_info=True,
+            )
+            await ws.close(code=4000)
+            await super().launch_shard(gateway, shard_id, initial=initial)
+            return
+        # if Discord rejects the RESUME, discord.py falls back to IDENTIFY by itself
+        self._resumed_shards.add(shard_id)
+        self._AutoShardedClient__shards[shard_id] = shard
+        shard.launch()
+
+    async def _restore_shard(self, session: GatewaySession) -> bool:
+        # Discord replays the missed events before RESUMED, the guilds need to be
+        # cached by then or the events referencing them are discarded
+        assert self.session_store is not None
+        shard_id = session.shard_id
+        time_left = self.session_store.get_time_left(session)
+        try:
+            guild_ids = await asyncio.wait_for(
+                self.session_store.get_guild_ids(self, shard_id), timeout=time_left
+            )
+            if len(guild_ids) > self.session_store.max_guilds:
+                log.info(
+                    "Not resuming the session of shard ID %s, it has %s guilds.",
+                    shard_id,
+                    len(guild_ids),
+                )
+                return False
+            await asyncio.wait_for(
+                restore_guilds(self, shard_id, guild_ids),
+                timeout=self.session_store.get_time_left(session),
+            )
+        except asyncio.TimeoutError:
+            log.info(
+                "Not resuming the session of shard ID %s,"
+                " restoring its guilds took longer than the resume window.",
+                shard_id,
+            )
+            return False
+        except discord.HTTPException:
+            log.warning(
+                "Failed to restore guilds of shard ID %s, identifying instead.",
+                shard_id,
+                exc_info=True,
+            )
+            return False
+        return True
+
+    async def on_shard_connect(self, shard_id: int) -> None:
+        # READY was received, the session was not resumed
+        self._resumed_shards.discard(shard_id)
+
+    async def on_shard_resumed(self, shard_id: int) -> None:
+        if shard_id not in self._resumed_shards:
+            return
+        self._resumed_shards.discard(shard_id)
+        # there's no READY after a RESUME so the shard's readiness is tracked here,
+        # its guilds were already restored before the RESUME was sent
+        state = self._connection
+        state._ready_tasks[shard_id] = asyncio.create_task(
+            self._dispatch_shard_ready(shard_id)
+        )
+        if len(state._ready_tasks) == len(state.shard_ids):
+            state._ready_task = asyncio.create_task(state._delay_ready())
+
+    async def _dispatch_shard_ready(self, shard_id: int) -> None:
+        self.dispatch("shard_ready", shard_id)
 
     async def on_ready(self) -> None:
         log.info("I am ready!")
+        self._log_cache_footprint()
+
+    async def close(self) -> None:
+        if not self.is_closed():
+            await self.invocations.drain(self.drain_timeout)
+            if self.session_store is not None:
+                await self.session_store.suspend_shards(self)
+        await super().close()
+        await self.send_queue.close()
+        if self.command_profiler.is_running:
+            self.command_profiler.stop()
+        self.prefix_manager.close()
+        if self.loop_monitor is not None:
+            self.loop_monitor.stop()
+        if self.hot_reloader is not None:
+            self.hot_reloader.stop()
+        if self.metrics is not None:
+            await self.metrics.stop_server()
+
+    def dispatch(self, event_name: str, /, *args: Any, **kwargs: Any) -> None:
+        if self.metrics is not None:
+            if event_name == "socket_event_type":
+                self.metrics.gateway_events.inc(args[0])
+            else:
+                self.metrics.events.inc(event_name)
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def get_context(
+        self,
+        origin: Union[discord.Message, discord.Interaction],
+        /,
+        *,
+        cls: Any = DpyContext,
+    ) -> Any:
+        return await super().get_context(origin, cls=cls)
+
+    def add_command(self, command: commands.Command, /) -> None:
+        super().add_command(command)
+        self.help_cache.clear()
+        if self.metrics is not None:
+            instrument_command(command, self.metrics.check_duration)
+
+    def remove_command(self, name: str, /) -> Optional[commands.Command]:
+        command = super().remove_command(name)
+        if command is not None:
+            self.help_cache.clear()
+        return command
+
+    async def invoke(self, ctx: commands.Context) -> None:
+        if self.invocations.draining:
+            return
+        profiler = self.command_profiler
+        with self.invocations.track():
+            if (
+                profiler.is_running
+                and ctx.command is not None
+                and profiler.should_profile(ctx.command.qualified_name)
+            ):
+                with profiler.profile():
+                    await self._invoke(ctx)
+            else:
+                await self._invoke(ctx)
+
+    async def _invoke(self, ctx: commands.Context) -> None:
+        if self.metrics is None or ctx.command is None:
+            await super().invoke(ctx)
+            return
+
+        ctx.invoke_started_at = time.perf_counter()
+        await super().invoke(ctx)
+        self.metrics.command_latency.observe(
+            time.perf_counter() - ctx.invoke_started_at,
+            ctx.command.qualified_name,
+            "error" if ctx.command_failed else "success",
+        )
+
+    async def _record_prepare_time(self, ctx: commands.Context) -> None:
+        # this is called after checks and converters ran successfully
+        started_at = getattr(ctx, "invoke_started_at", None)
+        if self.metrics is not None and started_at is not None:
+            self.metrics.command_prepare_time.observe(
+                time.perf_counter() - started_at, ctx.command.qualified_name
+            )
+
+    async def on_app_command_completion(
+        self,
+        interaction: discord.Interaction,
+        command: Union[app_commands.Command, app_commands.ContextMenu],
+    ) -> None:
+        if self.metrics is not None:
+            self.metrics.app_command_latency.observe(
+                (discord.utils.utcnow() - interaction.created_at).total_seconds(),
+                command.qualified_name,
+                "success",
+            )
+
+    async def _on_app_command_error(
+        self, interaction: discord.Interaction, error: app_commands.AppCommandError
+    ) -> None:
+        if self.metrics is not None and interaction.command is not None:
+            self.metrics.app_command_latency.observe(
+                (discord.utils.utcnow() - interaction.created_at).total_seconds(),
+                interaction.command.qualified_name,
+                "error",
+            )
+        await app_commands.CommandTree.on_error(self.tree, interaction, error)
 
     async def on_command_error(
         self, ctx: commands.Context, error: commands.CommandError
     ) -> None:
         if isinstance(error, commands.MissingRequiredArgument):
-            await ctx.send_help(ctx.command)
+            await self._send_error_help(ctx)
         elif isinstance(error, commands.BadArgument):
             if error.args:
                 await ctx.send(error.args[0])
             else:
-                await ctx.send_help(ctx.command)
+                await self._send_error_help(ctx)
         else:
             log.error(type(error).__name__, exc_info=error)
 
+    async def _send_error_help(self, ctx: commands.Context) -> None:
+        bucket = self._error_help_cooldown.get_bucket(ctx.message)
+        if bucket is not None and bucket.update_rate_limit():
+            return
+        await ctx.send_help(ctx.command)
+
+    def _update_intents(self, module: ModuleType) -> None:
+        required_intents = get_required_intents(module)
+        missing = discord.Intents._from_value(
+            required_intents.value & ~self.intents.value
+        )
+        if not missing.value:
+            return
+        if self._intents_locked:
+            log.warning(
+                "Extension %s requires intents that are not enabled: %s."
+                " Restart the bot to enable them.",
+                module.__name__,
+                format_flags(missing),
+            )
+            return
+
+        state = self._connection
+        intents = discord.Intents._from_value(self.intents.value | missing.value)
+        state._intents = intents
+        if not self._explicit_member_cache_flags:
+            state.member_cache_flags = discord.MemberCacheFlags.from_intents(intents)
+        if not self._explicit_chunk_guilds:
+            state._chunk_guilds = intents.members
+        log.info(
+            "Enabled intents required by extension %s: %s",
+            module.__name__,
+            format_flags(missing),
+        )
+
+    def _log_cache_config(self) -> None:
+        state = self._connection
+        log.info("Intents: %s", format_flags(self.intents))
+        log.info("Member cache flags: %s", format_flags(state.member_cache_flags))
+        log.info("Chunk guilds at startup: %s", state._chunk_guilds)
+        log.info("Max messages: %s", state.max_messages)
+
+    def _log_cache_footprint(self) -> None:
+        footprint = estimate_cache_footprint(self)
+        total = sum(footprint.values())
+        log.info(
+            "Estimated cache footprint: %.1f MiB (%s)",
+            total / 1024**2,
+            ", ".join(
+                f"{kind}s: {size / 1024**2:.1f} MiB" for kind, size in footprint.items()
+            ),
+        )
+
     async def reload_package(self, name: str) -> None:
         try:
             await self.reload_extension(f"dpybot.ext_cogs.{name}")
         except commands.ExtensionNotLoaded:
             await self.reload_extension(f"dpybot.cogs.{name}")
+            self._update_intents(self.extensions[f"dpybot.cogs.{name}"])
         except commands.ExtensionNotFound:
             await self.load_extension(f"dpybot.cogs.{name}")
+            self._update_intents(self.extensions[f"dpybot.cogs.{name}"])
+        else:
+            self._update_intents(self.extensions[f"dpybot.ext_cogs.{name}"])
+
+    def get_extension_name(self, name: str) -> str:
+        for parent in ("dpybot.ext_cogs", "dpybot.cogs"):
+            extension_name = f"{parent}.{name}"
+            if importlib.util.find_spec(extension_name) is not None:
+                return extension_name
+        raise commands.ExtensionNotFound(f"dpybot.cogs.{name}")
+
+    def is_package_loaded(self, name: str) -> bool:
+        return (
+            f"dpybot.ext_cogs.{name}" in self.extensions
+            or f"dpybot.cogs.{name}" in self.extensions
+        )
 
     async def load_package(self, name: str) -> None:
-        try:
-            await self.load_extension(f"dpybot.ext_cogs.{name}")
-        except commands.ExtensionNotFound:
-            await self.load_extension(f"dpybot.cogs.{name}")
+        extension_name = self.get_extension_name(name)
+        await self.load_extension(extension_name)
+        self._update_intents(self.extensions[extension_name])
 
     async def unload_package(self, name: str) -> None:
         try:
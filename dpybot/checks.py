@@ -0,0 +1,329 @@
+from __future__ import annotations
+
+import functools
+import time
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+from discord.utils import maybe_coroutine
+
+from dpybot import log
+from dpybot.metrics import Counter, Histogram
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+PredicateT = TypeVar("PredicateT", bound=Callable[..., Any])
+# (check name, check identity, user ID, channel ID, command name)
+CacheKey = Tuple[str, object, Optional[int], Optional[int], Optional[str]]
+
+# guild buckets with more entries than this get their expired entries removed
+_PRUNE_THRESHOLD = 1024
+
+
+def _get_check_name(predicate: Callable[..., Any]) -> str:
+    return getattr(predicate, "__qualname__", None) or repr(predicate)
+
+
+def _get_invocation_info(
+    ctx_or_interaction: Union[commands.Context, discord.Interaction],
+) -> Tuple[Optional[int], Optional[int], Optional[int], Optional[str]]:
+    # (guild ID, user ID, channel ID, command name)
+    if isinstance(ctx_or_interaction, discord.Interaction):
+        command = ctx_or_interaction.command
+        return (
+            ctx_or_interaction.guild_id,
+            ctx_or_interaction.user.id,
+            ctx_or_interaction.channel_id,
+            command.qualified_name if command is not None else None,
+        )
+    command = ctx_or_interaction.command
+    return (
+        ctx_or_interaction.guild.id if ctx_or_interaction.guild is not None else None,
+        ctx_or_interaction.author.id,
+        ctx_or_interaction.channel.id,
+        command.qualified_name if command is not None else None,
+    )
+
+
+def _get_client(
+    ctx_or_interaction: Union[commands.Context, discord.Interaction],
+) -> discord.Client:
+    if isinstance(ctx_or_interaction, discord.Interaction):
+        return ctx_or_interaction.client
+    return ctx_or_interaction.bot
+
+
+class CheckCache:
+    """
+    Cache of check results.
+
+    Entries are grouped by guild so that role and permission changes,
+    which are per-guild, can invalidate them without scanning the whole cache.
+    """
+
+    def __init__(self) -> None:
+        # guild_id: {key: (expires_at, result)}
+        self._entries: Dict[Optional[int], Dict[CacheKey, Tuple[float, bool]]] = {}
+        self.requests = Counter(
+            "dpybot_check_cache_requests",
+            "Lookups of cached check results.",
+            ("check", "result"),
+        )
+
+    def get(self, guild_id: Optional[int], key: CacheKey) -> Optional[bool]:
+        bucket = self._entries.get(guild_id)
+        entry = bucket.get(key) if bucket is not None else None
+        if entry is None:
+            self.requests.inc(key[0], "miss")
+            return None
+        expires_at, result = entry
+        if expires_at <= time.monotonic():
+            del bucket[key]  # type: ignore[union-attr]
+            self.requests.inc(key[0], "miss")
+            return None
+        self.requests.inc(key[0], "hit")
+        return result
+
+    def set(
+        self, guild_id: Optional[int], key: CacheKey, result: bool, ttl: float
+    ) -> None:
+        bucket = self._entries.setdefault(guild_id, {})
+        now = time.monotonic()
+        if len(bucket) >= _PRUNE_THRESHOLD:
+            for expired_key in [k for k, (exp, _) in bucket.items() if exp <= now]:
+                del bucket[expired_key]
+        bucket[key] = (now + ttl, result)
+
+    def invalidate(
+        self, guild_id: Optional[int] = None, user_id: Optional[int] = None
+    ) -> None:
+        """
+        Remove cached results for the given guild and/or user.
+
+        Without any arguments, the whole cache is cleared.
+        """
+        if guild_id is None and user_id is None:
+            self._entries.clear()
+            return
+        buckets = (
+            [self._entries.get(guild_id)]
+            if guild_id is not None
+            else list(self._entries.values())
+        )
+        for bucket in buckets:
+            if bucket is None:
+                continue
+            if user_id is None:
+                bucket.clear()
+                continue
+            for key in [key for key in bucket if key[2] == user_id]:
+                del bucket[key]
+
+
+CHECK_CACHE = CheckCache()
+_warned_checks: Set[str] = set()
+
+
+def _warn_members_intent(check_name: str) -> None:
+    if check_name in _warned_checks:
+        return
+    _warned_checks.add(check_name)
+    log.warning(
+        "Results of check %s are not cached because the members intent is disabled"
+        " and role changes couldn't invalidate them.",
+        check_name,
+    )
+
+
+def cached_check(
+    *,
+    ttl: float = 60.0,
+    per_channel: bool = True,
+    per_command: bool = True,
+    name: Optional[str] = None,
+) -> Callable[[PredicateT], PredicateT]:
+    """
+    Cache results of the decorated check predicate for `ttl` seconds.
+
+    Results are cached per guild, user and, unless `per_channel`/`per_command`
+    is False, channel and command. Checks that depend on channel permissions
+    must keep `per_channel` enabled. The decorated predicate can be passed
+    to both `commands.check()` and `app_commands.check()`. Only boolean results
+    are cached, exceptions raised by the predicate propagate as usual.
+
+    Cached results are invalidated when the user's roles change, when
+    the guild's roles or channel permission overwrites change, or with
+    `CHECK_CACHE.invalidate()`. Role changes are only received with the members
+    intent, so without it, results aren't cached at all - packages using cached
+    checks should declare it in their `REQUIRED_INTENTS`.
+    """
+
+    def decorator(predicate: PredicateT) -> PredicateT:
+        check_name = name or _get_check_name(predicate)
+        # predicates made by the same factory share their name but not their results
+        check_id = object()
+
+        @functools.wraps(predicate)
+        async def wrapper(
+            ctx_or_interaction: Union[commands.Context, discord.Interaction],
+        ) -> bool:
+            if not _get_client(ctx_or_interaction).intents.members:
+                _warn_members_intent(check_name)
+                return bool(await maybe_coroutine(predicate, ctx_or_interaction))
+            guild_id, user_id, channel_id, command_name = _get_invocation_info(
+                ctx_or_interaction
+            )
+            key = (
+                check_name,
+                check_id,
+                user_id,
+                channel_id if per_channel else None,
+                command_name if per_command else None,
+            )
+            result = CHECK_CACHE.get(guild_id, key)
+            if result is None:
+                result = bool(await maybe_coroutine(predicate, ctx_or_interaction))
+                CHECK_CACHE.set(guild_id, key, result, ttl)
+            return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def _timed(
+    predicate: Callable[..., Any], histogram: Histogram, check_name: str
+) -> Callable[..., Any]:
+    if getattr(predicate, "__dpybot_timed__", False):
+        return predicate
+
+    @functools.wraps(predicate)
+    async def wrapper(*args: Any) -> Any:
+        started_at = time.perf_counter()
+        try:
+            return await maybe_coroutine(predicate, *args)
+        finally:
+            ctx_or_interaction = args[-1]
+            command_name = _get_invocation_info(ctx_or_interaction)[3]
+            histogram.observe(
+                time.perf_counter() - started_at, check_name, command_name or ""
+            )
+
+    wrapper.__dpybot_timed__ = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+def _time_interaction_check(
+    obj: Union[app_commands.Group, commands.Cog],
+    base_cls: type,
+    name: str,
+    histogram: Histogram,
+) -> None:
+    check = obj.interaction_check
+    # only overridden checks are worth timing
+    if getattr(check, "__func__", None) is base_cls.interaction_check:
+        return
+    obj.interaction_check = _timed(  # type: ignore[method-assign]
+        check, histogram, f"{name}:interaction_check"
+    )
+
+
+def instrument_command(
+    command: Union[
+        commands.Command,
+        app_commands.Command,
+        app_commands.Group,
+        app_commands.ContextMenu,
+    ],
+    histogram: Histogram,
+) -> None:
+    """Time the checks of the given command and, if it's a group, its subcommands."""
+    if isinstance(command, commands.Command):
+        targets = [command]
+        if isinstance(command, commands.Group):
+            targets.extend(command.walk_commands())
+        for target in targets:
+            target.checks = [
+                _timed(check, histogram, _get_check_name(check))
+                for check in target.checks
+            ]
+        return
+
+    targets = [command]
+    if isinstance(command, app_commands.Group):
+        targets.extend(command.walk_commands())
+    for target in targets:
+        if isinstance(target, app_commands.Group):
+            _time_interaction_check(
+                target, app_commands.Group, target.qualified_name, histogram
+            )
+            continue
+        target.checks = [
+            _timed(check, histogram, _get_check_name(check)) for check in target.checks
+        ]
+        # cog-level check of commands bound to a cog
+        binding = getattr(target, "binding", None)
+        if isinstance(binding, commands.Cog):
+            _time_interaction_check(
+                binding, commands.Cog, binding.qualified_name, histogram
+            )
+
+
+class CheckCacheInvalidator(commands.Cog):
+    """Invalidates cached check results on role and permission changes."""
+
+    def __init__(self, bot: DpyBot) -> None:
+        self.bot = bot
+
+    @commands.Cog.listener()
+    async def on_member_update(
+        self, before: discord.Member, after: discord.Member
+    ) -> None:
+        if before.roles != after.roles:
+            CHECK_CACHE.invalidate(after.guild.id, after.id)
+
+    @commands.Cog.listener()
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent) -> None:
+        CHECK_CACHE.invalidate(payload.guild_id, payload.user.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_update(
+        self, before: discord.Role, after: discord.Role
+    ) -> None:
+        if before.permissions != after.permissions:
+            CHECK_CACHE.invalidate(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_role_delete(self, role: discord.Role) -> None:
+        CHECK_CACHE.invalidate(role.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ) -> None:
+        if before.overwrites != after.overwrites:
+            CHECK_CACHE.invalidate(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_update(
+        self, before: discord.Guild, after: discord.Guild
+    ) -> None:
+        if before.owner_id != after.owner_id:
+            CHECK_CACHE.invalidate(after.id)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        CHECK_CACHE.invalidate(guild.id)
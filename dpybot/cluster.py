@@ -0,0 +1,194 @@
+import asyncio
+import multiprocessing
+import multiprocessing.context
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import discord
+
+from dpybot import config, log
+
+# Discord allows a single IDENTIFY per rate limit bucket every 5 seconds
+IDENTIFY_INTERVAL = 5.0
+# clusters that ran for longer than this get their restart backoff reset
+STABLE_RUN_TIME = 60.0
+MAX_RESTART_DELAY = 60.0
+SHUTDOWN_TIMEOUT = 10.0
+
+
+class IdentifyThrottle:
+    """
+    Cross-process IDENTIFY rate limiter.
+
+    Shards with the same ``shard_id % max_concurrency`` share a rate limit bucket
+    and have to identify at least `IDENTIFY_INTERVAL` seconds apart,
+    even when they're running in different processes.
+    """
+
+    def __init__(
+        self, ctx: multiprocessing.context.BaseContext, max_concurrency: int
+    ) -> None:
+        self.max_concurrency = max_concurrency
+        self._locks = [ctx.Lock() for _ in range(max_concurrency)]
+        self._last_identify = ctx.Array("d", max_concurrency, lock=False)
+
+    def _wait_blocking(self, shard_id: int) -> None:
+        bucket = shard_id % self.max_concurrency
+        with self._locks[bucket]:
+            delay = self._last_identify[bucket] + IDENTIFY_INTERVAL - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            self._last_identify[bucket] = time.time()
+
+    async def wait(self, shard_id: int) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self._wait_blocking, shard_id)
+
+
+def split_shards(shard_count: int, cluster_count: int) -> List[List[int]]:
+    cluster_count = max(1, min(cluster_count, shard_count))
+    per_cluster, extra = divmod(shard_count, cluster_count)
+    clusters = []
+    start = 0
+    for cluster_id in range(cluster_count):
+        end = start + per_cluster + (1 if cluster_id < extra else 0)
+        clusters.append(list(range(start, end)))
+        start = end
+    return clusters
+
+
+async def _fetch_gateway_info(token: str) -> Tuple[int, int]:
+    http = discord.http.HTTPClient(asyncio.get_running_loop())
+    try:
+        await http.static_login(token)
+        shard_count, _, session_start_limit = await http.get_bot_gateway()
+    finally:
+        await http.close()
+    return shard_count, session_start_limit["max_concurrency"]
+
+
+def get_gateway_info(token: str) -> Tuple[int, int]:
+    config.apply_endpoint_overrides()
+    shard_count = config.get_int("DPYBOT_SHARD_COUNT")
+    max_concurrency = config.get_int("DPYBOT_MAX_CONCURRENCY")
+    if shard_count is None or max_concurrency is None:
+        recommended_count, recommended_concurrency = asyncio.run(
+            _fetch_gateway_info(token)
+        )
+        if shard_count is None:
+            shard_count = recommended_count
+        if max_concurrency is None:
+            max_concurrency = recommended_concurrency
+    return shard_count, max_concurrency
+
+
+def _run_cluster(
+    cluster_id: int,
+    shard_ids: List[int],
+    shard_count: int,
+    identify_throttle: IdentifyThrottle,
+    cli_flags: Dict[str, Any],
+) -> None:
+    from dpybot.__main__ import run_bot, setup_logging
+
+    os.environ["DPYBOT_CLUSTER_ID"] = str(cluster_id)
+    setup_logging(cli_flags.pop("debug"), cluster_id=cluster_id)
+    log.info("Cluster %s starting with shards: %s", cluster_id, shard_ids)
+    run_bot(
+        # the app command tree is global so syncing it once is enough
+        sync_on_startup=cluster_id == 0,
+        shard_ids=shard_ids,
+        shard_count=shard_count,
+        identify_throttle=identify_throttle,
+        **cli_flags,
+    )
+
+
+class _Cluster:
+    def __init__(self, cluster_id: int, shard_ids: Sequence[int]) -> None:
+        self.id = cluster_id
+        self.shard_ids = list(shard_ids)
+        self.process: Optional[multiprocessing.process.BaseProcess] = None
+        self.started_at = 0.0
+        self.restart_delay = 1.0
+        self.restart_at: Optional[float] = None
+
+
+def run_clusters(cluster_count: int, cli_flags: Dict[str, Any]) -> None:
+    TOKEN = os.environ["DPYBOT_TOKEN"]
+    shard_count, max_concurrency = get_gateway_info(TOKEN)
+    ctx = multiprocessing.get_context("spawn")
+    identify_throttle = IdentifyThrottle(ctx, max_concurrency)
+    clusters = [
+        _Cluster(cluster_id, shard_ids)
+        for cluster_id, shard_ids in enumerate(split_shards(shard_count, cluster_count))
+    ]
+    log.info(
+        "Starting %s clusters for %s shards (max_concurrency=%s).",
+        len(clusters),
+        shard_count,
+        max_concurrency,
+    )
+
+    def start(cluster: _Cluster) -> None:
+        cluster.process = ctx.Process(
+            target=_run_cluster,
+            args=(
+                cluster.id,
+                cluster.shard_ids,
+                shard_count,
+                identify_throttle,
+                dict(cli_flags),
+            ),
+            name=f"dpybot-cluster-{cluster.id}",
+        )
+        cluster.process.start()
+        cluster.started_at = time.monotonic()
+        cluster.restart_at = None
+
+    for cluster in clusters:
+        start(cluster)
+
+    running = list(clusters)
+    try:
+        while running:
+            time.sleep(1)
+            now = time.monotonic()
+            for cluster in list(running):
+                process = cluster.process
+                assert process is not None
+                if cluster.restart_at is not None:
+                    if now >= cluster.restart_at:
+                        log.info("Restarting cluster %s...", cluster.id)
+                        start(cluster)
+                    continue
+                if process.is_alive():
+                    continue
+
+                if process.exitcode == 0:
+                    log.info("Cluster %s exited cleanly.", cluster.id)
+                    running.remove(cluster)
+                    continue
+
+                if now - cluster.started_at > STABLE_RUN_TIME:
+                    cluster.restart_delay = 1.0
+                log.error(
+                    "Cluster %s exited with exit code %s, restarting in %s seconds.",
+                    cluster.id,
+                    process.exitcode,
+                    cluster.restart_delay,
+                )
+                cluster.restart_at = now + cluster.restart_delay
+                cluster.restart_delay = min(
+                    cluster.restart_delay * 2, MAX_RESTART_DELAY
+                )
+    finally:
+        # on Ctrl+C, the clusters receive SIGINT too so give them a chance
+        # to shut down gracefully before terminating them
+        for cluster in running:
+            if cluster.process is not None:
+                cluster.process.join(SHUTDOWN_TIMEOUT)
+                if cluster.process.is_alive():
+                    cluster.process.terminate()
+                    cluster.process.join()
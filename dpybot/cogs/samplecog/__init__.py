@@ -1,7 +1,10 @@
+import discord
 from discord.ext import commands
 
 from .core import SampleCog
 
+REQUIRED_INTENTS = discord.Intents(guilds=True, messages=True, message_content=True)
+
 
 async def setup(bot: commands.Bot) -> None:
     await bot.add_cog(SampleCog(bot))
@@ -0,0 +1,181 @@
+import asyncio
+import contextlib
+import cProfile
+import io
+import pstats
+import random
+import re
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator, Optional
+
+from dpybot import config, log
+
+
+class ProfileReport:
+    def __init__(
+        self,
+        *,
+        target: Optional[str],
+        sample_rate: float,
+        invocations: int,
+        duration: float,
+        stats: Optional[pstats.Stats],
+        path: Optional[Path],
+    ) -> None:
+        self.target = target
+        self.sample_rate = sample_rate
+        self.invocations = invocations
+        self.duration = duration
+        self.stats = stats
+        self.path = path
+
+    def format_summary(self, top: int = 15, *, max_length: int = 2000) -> str:
+        scope = (
+            f"command `{self.target}`"
+            if self.target is not None
+            else f"{self.sample_rate:.0%} of all commands"
+        )
+        header = (
+            f"Profiled {self.invocations} invocation(s) of {scope}"
+            f" over {self.duration:.0f} seconds."
+        )
+        if self.stats is None:
+            return header
+        stream = io.StringIO()
+        self.stats.stream = stream  # type: ignore[attr-defined]
+        # the full report keeps the paths, they'd take too much space here
+        self.stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        # skip pstats' own header, only the table is interesting here
+        lines = stream.getvalue().splitlines()
+        table_start = next(
+            (idx for idx, line in enumerate(lines) if "ncalls" in line), 0
+        )
+        table_lines = [line for line in lines[table_start:] if line.strip()]
+        while True:
+            table = "\n".join(table_lines)
+            summary = f"{header}\nFull report: `{self.path}`\n```\n{table}\n```"
+            # keep it within Discord's message length limit
+            if len(summary) <= max_length or len(table_lines) <= 1:
+                return summary
+            table_lines.pop()
+
+
+class CommandProfiler:
+    """
+    cProfile-based profiler of command and app command invocations.
+
+    A single profile is shared by all sampled invocations and it's enabled
+    while at least one of them is running. Since invocations are coroutines,
+    whatever else runs on the event loop in the meantime ends up in the profile
+    as well, which is negligible for a slow command but worth keeping in mind
+    when profiling many fast, concurrent invocations.
+    """
+
+    def __init__(self) -> None:
+        self.target: Optional[str] = None
+        self.sample_rate = 1.0
+        self.invocations = 0
+        self._profile: Optional[cProfile.Profile] = None
+        self._active = 0
+        self._started_at = 0.0
+        self._window_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._profile is not None
+
+    def start(
+        self,
+        *,
+        target: Optional[str] = None,
+        sample_rate: float = 1.0,
+        duration: float,
+        on_finish: Callable[[ProfileReport], Awaitable[None]],
+    ) -> None:
+        if self.is_running:
+            raise RuntimeError("The profiler is already running.")
+        self.target = target
+        self.sample_rate = sample_rate
+        self.invocations = 0
+        self._profile = cProfile.Profile()
+        self._started_at = time.monotonic()
+        self._window_task = asyncio.create_task(self._run_window(duration, on_finish))
+
+    async def _run_window(
+        self, duration: float, on_finish: Callable[[ProfileReport], Awaitable[None]]
+    ) -> None:
+        await asyncio.sleep(duration)
+        self._window_task = None
+        report = self.stop()
+        try:
+            await on_finish(report)
+        except Exception:
+            log.exception("Failed to send the command profile report.")
+
+    def stop(self) -> ProfileReport:
+        if self._profile is None:
+            raise RuntimeError("The profiler isn't running.")
+        if self._window_task is not None:
+            self._window_task.cancel()
+            self._window_task = None
+        profile = self._profile
+        self._profile = None
+        if self._active:
+            profile.disable()
+            self._active = 0
+
+        stats = None
+        path = None
+        if self.invocations:
+            stats = pstats.Stats(profile)
+            path = self._write_report(stats)
+        return ProfileReport(
+            target=self.target,
+            sample_rate=self.sample_rate,
+            invocations=self.invocations,
+            duration=time.monotonic() - self._started_at,
+            stats=stats,
+            path=path,
+        )
+
+    def _write_report(self, stats: pstats.Stats) -> Path:
+        profiles_dir = config.get_data_path("profiles")
+        profiles_dir.mkdir(exist_ok=True)
+        timestamp = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        name = re.sub(r"[^\w-]", "_", self.target or "sampled")
+        path = profiles_dir / f"{timestamp}-{name}.txt"
+        # raw stats can be inspected with e.g. snakeviz
+        stats.dump_stats(path.with_suffix(".prof"))
+        with path.open("w", encoding="utf-8") as fp:
+            stats.stream = fp  # type: ignore[attr-defined]
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats()
+        log.info("Command profile report written to %s", path)
+        return path
+
+    def should_profile(self, command_name: str) -> bool:
+        if self._profile is None:
+            return False
+        if self.target is not None:
+            return command_name == self.target
+        return random.random() < self.sample_rate
+
+    @contextlib.contextmanager
+    def profile(self) -> Iterator[None]:
+        profile = self._profile
+        if profile is None:
+            yield
+            return
+        self.invocations += 1
+        if not self._active:
+            profile.enable()
+        self._active += 1
+        try:
+            yield
+        finally:
+            # the profiler could have been stopped during the invocation
+            if self._profile is profile:
+                self._active -= 1
+                if not self._active:
+                    profile.disable()
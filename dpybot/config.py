@@ -0,0 +1,66 @@
+import os
+from pathlib import Path
+from typing import List, Optional
+
+import discord
+import yarl
+
+_TRUE_VALUES = ("1", "true", "yes", "on")
+_FALSE_VALUES = ("0", "false", "no", "off")
+
+
+def get_str(name: str, default: Optional[str] = None) -> Optional[str]:
+    value = os.getenv(name, "").strip().strip("\"'")
+    return value or default
+
+
+def get_bool(name: str, default: Optional[bool] = None) -> Optional[bool]:
+    value = get_str(name)
+    if value is None:
+        return default
+    if value.lower() in _TRUE_VALUES:
+        return True
+    if value.lower() in _FALSE_VALUES:
+        return False
+    raise ValueError(f"{name} needs to be a boolean value, got {value!r}")
+
+
+def get_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = get_str(name)
+    if value is None:
+        return default
+    if value.lower() == "none":
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} needs to be an integer, got {value!r}") from None
+
+
+def get_float(name: str, default: Optional[float] = None) -> Optional[float]:
+    value = get_str(name)
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        raise ValueError(f"{name} needs to be a number, got {value!r}") from None
+
+
+def get_list(name: str) -> List[str]:
+    value = get_str(name, "")
+    return [item.strip() for item in value.split(",") if item.strip()]
+
+
+def get_data_path(name: str) -> Path:
+    data_dir = Path(get_str("DPYBOT_DATA_DIR", "data"))
+    data_dir.mkdir(parents=True, exist_ok=True)
+    return data_dir / name
+
+
+def apply_endpoint_overrides() -> None:
+    # allows running the bot against a local fake gateway / HTTP API
+    if api_base := get_str("DPYBOT_API_BASE"):
+        discord.http.Route.BASE = api_base
+    if gateway_url := get_str("DPYBOT_GATEWAY_URL"):
+        discord.gateway.DiscordWebSocket.DEFAULT_GATEWAY = yarl.URL(gateway_url)
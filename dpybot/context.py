@@ -0,0 +1,38 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Optional
+
+import discord
+from discord.ext import commands
+
+from dpybot.send_queue import Priority
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+
+class DpyContext(commands.Context["DpyBot"]):
+    async def send(
+        self,
+        content: Optional[Any] = None,
+        *,
+        coalesce: bool = False,
+        priority: Priority = Priority.COMMAND,
+        **kwargs: Any,
+    ) -> discord.Message:
+        """
+        Send a message through the bot's send queue.
+
+        See `SendQueue.send()` for the meaning of `coalesce` and `priority`.
+        Responses to interactions (hybrid commands) aren't queued
+        but they get a send slot before any other queued message.
+        """
+        send_queue = self.bot.send_queue
+        if self.interaction is not None:
+            async with send_queue.slot(Priority.INTERACTION):
+                return await super().send(content, **kwargs)
+        # only meaningful for interactions
+        kwargs.pop("ephemeral", None)
+        return await send_queue.send(
+            self.channel, content, coalesce=coalesce, priority=priority, **kwargs
+        )
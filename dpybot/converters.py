@@ -0,0 +1,135 @@
+import functools
+from enum import Enum
+from typing import Any, Dict, Generic, List, Mapping, Optional, Type, TypeVar, Union
+
+import discord
+from discord import app_commands
+from discord.ext import commands
+
+T = TypeVar("T")
+
+# Discord doesn't allow more choices than this, autocomplete is used instead
+MAX_CHOICES = 25
+
+
+class LookupConverter(commands.Converter[T], app_commands.Transformer, Generic[T]):
+    """
+    Converter mapping an argument to a value from a precomputed lookup table.
+
+    It can be used as the annotation of prefix, hybrid and app command parameters.
+    Use `lookup_converter()` to create one.
+    """
+
+    def __init__(
+        self,
+        lookup: Dict[str, T],
+        choices: Dict[str, T],
+        *,
+        display_name: str,
+        cache_size: int,
+    ) -> None:
+        super().__init__()
+        # case-folded value, name or alias: result
+        self._lookup = lookup
+        # choice name: result
+        self._choices = choices
+        self._choice_list = [
+            app_commands.Choice(name=name, value=name) for name in choices
+        ]
+        self.display_name = display_name
+        # arguments are usually repeated so even the case folding is worth skipping
+        self._cached_lookup = functools.lru_cache(maxsize=cache_size)(
+            self._lookup_uncached
+        )
+
+    def _lookup_uncached(self, argument: str) -> Optional[T]:
+        return self._lookup.get(argument.strip().casefold())
+
+    def lookup(self, argument: str) -> Optional[T]:
+        return self._cached_lookup(argument)
+
+    async def convert(self, ctx: commands.Context, argument: str) -> T:
+        result = self._cached_lookup(argument)
+        if result is None:
+            raise commands.BadArgument(
+                f"`{argument}` is not a valid {self.display_name}."
+            )
+        return result
+
+    @property
+    def _error_display_name(self) -> str:
+        return self.display_name
+
+    @property
+    def type(self) -> discord.AppCommandOptionType:
+        return discord.AppCommandOptionType.string
+
+    @property
+    def choices(self) -> Optional[List[app_commands.Choice[str]]]:
+        return self._choice_list
+
+    async def transform(self, interaction: discord.Interaction, value: str, /) -> T:
+        result = self._cached_lookup(value)
+        if result is None:
+            raise app_commands.TransformerError(value, self.type, self)
+        return result
+
+
+class AutocompleteLookupConverter(LookupConverter[T]):
+    """`LookupConverter` with more values than can be used as app command choices."""
+
+    @property
+    def choices(self) -> Optional[List[app_commands.Choice[str]]]:
+        return None
+
+    async def autocomplete(
+        self, interaction: discord.Interaction, value: Union[int, float, str], /
+    ) -> List[app_commands.Choice[Union[int, float, str]]]:
+        current = str(value).casefold()
+        return [
+            choice for choice in self._choice_list if current in choice.name.casefold()
+        ][:MAX_CHOICES]
+
+
+def lookup_converter(
+    source: Union[Type[Enum], Mapping[str, T]],
+    *,
+    aliases: Optional[Mapping[str, Any]] = None,
+    display_name: Optional[str] = None,
+    cache_size: int = 1024,
+) -> LookupConverter:
+    """
+    Create a converter for the members of an `Enum` or the values of a mapping.
+
+    An Enum member can be passed by its name, its value or any of its aliases,
+    mapping values can be passed by their key. Both can also be passed by
+    any of the `aliases`, which map to an Enum member or a mapping value.
+    All of these are case-insensitive. The names of Enum members and the mapping keys
+    are used as app command choices or, if there are too many of them, autocomplete.
+    """
+    lookup: Dict[str, Any] = {}
+    choices: Dict[str, Any]
+    if isinstance(source, type) and issubclass(source, Enum):
+        choices = {member.name: member for member in source}
+        # values are only used if they don't conflict with any name
+        for member in source:
+            lookup.setdefault(str(member.value).casefold(), member)
+        # this includes the names of the Enum's aliases
+        for name, member in source.__members__.items():
+            lookup[name.casefold()] = member
+        if display_name is None:
+            display_name = source.__name__
+    else:
+        choices = dict(source)
+        for name, value in source.items():
+            lookup[name.casefold()] = value
+        if display_name is None:
+            display_name = "value"
+    if aliases is not None:
+        for alias, value in aliases.items():
+            lookup[alias.casefold()] = value
+
+    cls = (
+        LookupConverter if len(choices) <= MAX_CHOICES else AutocompleteLookupConverter
+    )
+    return cls(lookup, choices, display_name=display_name, cache_size=cache_size)
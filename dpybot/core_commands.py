@@ -1,10 +1,13 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Literal, Optional
 
+import discord
 from discord.ext import commands
 
 from dpybot import log
+from dpybot.command_profiler import ProfileReport
+from dpybot.tree_sync import sync_tree
 
 if TYPE_CHECKING:
     from dpybot.bot import DpyBot
@@ -39,6 +42,7 @@ class Core(commands.Cog):
             )
         else:
             await ctx.send(f"{pkg_name} reloaded.")
+            await self._sync_tree(ctx)
 
     @commands.is_owner()
     @commands.command()
@@ -65,6 +69,7 @@ class Core(commands.Cog):
             )
         else:
             await ctx.send(f"{pkg_name} loaded.")
+            await self._sync_tree(ctx)
 
     @commands.is_owner()
     @commands.command()
@@ -75,11 +80,191 @@ class Core(commands.Cog):
             await ctx.send(f"Cog package with name `{pkg_name}` wasn't loaded.")
         else:
             await ctx.send(f"{pkg_name} unloaded.")
+            await self._sync_tree(ctx)
+
+    async def _sync_tree(
+        self, ctx: commands.Context, *, force: bool = False, quiet: bool = True
+    ) -> None:
+        try:
+            diffs = await sync_tree(self.bot, force=force)
+        except discord.HTTPException as e:
+            await ctx.send(
+                "App commands couldn't be synced. See logs for more details."
+            )
+            log.error("App command tree couldn't be synced.", exc_info=e)
+            return
+        changes = [diff for diff in diffs if not diff.is_empty]
+        if changes:
+            await ctx.send(
+                "Synced app commands:\n```diff\n"
+                + "\n".join(diff.format() for diff in changes)
+                + "\n```"
+            )
+        elif not quiet:
+            await ctx.send("App commands are up to date.")
+
+    @commands.is_owner()
+    @commands.command()
+    async def sync(
+        self,
+        ctx: commands.Context,
+        mode: Optional[Literal["dry-run", "force"]] = None,
+    ) -> None:
+        """
+        Sync app commands that changed since the last sync.
+
+        With `dry-run`, only show what would be synced.
+        With `force`, overwrite all app commands.
+        """
+        if mode == "dry-run":
+            diffs = await sync_tree(self.bot, dry_run=True)
+            await ctx.send(
+                "```diff\n" + "\n".join(diff.format() for diff in diffs) + "\n```"
+            )
+            return
+        await self._sync_tree(ctx, force=mode == "force", quiet=False)
+
+    @commands.is_owner()
+    @commands.guild_only()
+    @commands.group(invoke_without_command=True)
+    async def prefix(self, ctx: commands.Context) -> None:
+        prefix_manager = self.bot.prefix_manager
+        guild_prefixes = prefix_manager.get_prefixes(ctx.guild.id)
+        channel_prefixes = prefix_manager.get_prefixes(ctx.guild.id, ctx.channel.id)
+        await ctx.send(
+            "Prefixes in this server: "
+            + ", ".join(f"`{prefix}`" for prefix in guild_prefixes)
+            + "\nPrefixes in this channel: "
+            + ", ".join(f"`{prefix}`" for prefix in channel_prefixes)
+        )
+
+    @commands.is_owner()
+    @commands.guild_only()
+    @prefix.command(name="set")
+    async def prefix_set(self, ctx: commands.Context, *prefixes: str) -> None:
+        if not prefixes:
+            await ctx.send_help(ctx.command)
+            return
+        self.bot.prefix_manager.set_prefixes(ctx.guild.id, None, prefixes)
+        await ctx.send("Prefixes for this server set.")
+
+    @commands.is_owner()
+    @commands.guild_only()
+    @prefix.command(name="clear")
+    async def prefix_clear(self, ctx: commands.Context) -> None:
+        self.bot.prefix_manager.clear_prefixes(ctx.guild.id, None)
+        await ctx.send("Prefixes for this server cleared.")
+
+    @commands.is_owner()
+    @commands.guild_only()
+    @prefix.command(name="setchannel")
+    async def prefix_setchannel(self, ctx: commands.Context, *prefixes: str) -> None:
+        if not prefixes:
+            await ctx.send_help(ctx.command)
+            return
+        self.bot.prefix_manager.set_prefixes(ctx.guild.id, ctx.channel.id, prefixes)
+        await ctx.send("Prefixes for this channel set.")
+
+    @commands.is_owner()
+    @commands.guild_only()
+    @prefix.command(name="clearchannel")
+    async def prefix_clearchannel(self, ctx: commands.Context) -> None:
+        self.bot.prefix_manager.clear_prefixes(ctx.guild.id, ctx.channel.id)
+        await ctx.send("Prefixes for this channel cleared.")
 
     @commands.command()
     async def ping(self, ctx: commands.Context) -> None:
         await ctx.send("Pong!")
 
+    @commands.is_owner()
+    @commands.command()
+    async def looplag(self, ctx: commands.Context) -> None:
+        loop_monitor = self.bot.loop_monitor
+        if loop_monitor is None:
+            await ctx.send("Event loop monitor is disabled.")
+            return
+        percentiles = loop_monitor.get_percentiles()
+        if not percentiles:
+            await ctx.send("No event loop lag samples were collected yet.")
+            return
+        await ctx.send(
+            "Event loop lag: "
+            + ", ".join(
+                f"{name}: {value * 1000:.1f} ms" for name, value in percentiles.items()
+            )
+            + f"\nStalls over threshold: {loop_monitor.stall_count}"
+        )
+
+    @commands.is_owner()
+    @commands.group(invoke_without_command=True)
+    async def profile(self, ctx: commands.Context) -> None:
+        profiler = self.bot.command_profiler
+        if not profiler.is_running:
+            await ctx.send("The command profiler isn't running.")
+            return
+        scope = (
+            f"command `{profiler.target}`"
+            if profiler.target is not None
+            else f"{profiler.sample_rate:.0%} of all commands"
+        )
+        await ctx.send(
+            f"Profiling {scope}, {profiler.invocations} invocation(s) profiled so far."
+        )
+
+    async def _start_profiler(
+        self,
+        ctx: commands.Context,
+        duration: float,
+        *,
+        target: Optional[str] = None,
+        sample_rate: float = 1.0,
+    ) -> None:
+        async def send_report(report: ProfileReport) -> None:
+            await ctx.send(report.format_summary())
+
+        try:
+            self.bot.command_profiler.start(
+                target=target,
+                sample_rate=sample_rate,
+                duration=duration,
+                on_finish=send_report,
+            )
+        except RuntimeError:
+            await ctx.send(
+                "The command profiler is already running,"
+                f" use `{ctx.clean_prefix}profile stop` to stop it."
+            )
+        else:
+            await ctx.send(f"Profiling for the next {duration:.0f} seconds.")
+
+    @commands.is_owner()
+    @profile.command(name="command")
+    async def profile_command(
+        self, ctx: commands.Context, duration: float, *, command_name: str
+    ) -> None:
+        """Profile all invocations of the given command or app command."""
+        await self._start_profiler(ctx, duration, target=command_name)
+
+    @commands.is_owner()
+    @profile.command(name="sample")
+    async def profile_sample(
+        self, ctx: commands.Context, duration: float, sample_rate: float
+    ) -> None:
+        """Profile a fraction (between 0 and 1) of all command invocations."""
+        if not 0 < sample_rate <= 1:
+            await ctx.send("Sample rate needs to be between 0 and 1.")
+            return
+        await self._start_profiler(ctx, duration, sample_rate=sample_rate)
+
+    @commands.is_owner()
+    @profile.command(name="stop")
+    async def profile_stop(self, ctx: commands.Context) -> None:
+        profiler = self.bot.command_profiler
+        if not profiler.is_running:
+            await ctx.send("The command profiler isn't running.")
+            return
+        await ctx.send(profiler.stop().format_summary())
+
     @commands.is_owner()
     @commands.command()
     async def shutdown(self, ctx: commands.Context) -> None:
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import discord
+import yarl
+from discord.gateway import DiscordWebSocket
+from discord.shard import Shard
+
+from dpybot import config, log
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+# guilds restored over the HTTP API at once after a resume
+RESTORE_CONCURRENCY = 10
+
+
+def supports_resume(bot: DpyBot) -> bool:
+    """
+    Check whether discord.py still has the internals needed for resuming sessions.
+
+    Suspending shards and launching them with a resumed connection isn't supported
+    by discord.py's public API and its internals can change on master,
+    in which case the shards should identify as usual.
+    """
+    state = bot._connection
+    return (
+        hasattr(discord.ShardInfo, "_parent")
+        and hasattr(Shard, "_cancel_task")
+        and hasattr(bot, "_AutoShardedClient__queue")
+        and isinstance(getattr(bot, "_AutoShardedClient__shards", None), dict)
+        and isinstance(getattr(state, "_ready_tasks", None), dict)
+        and callable(getattr(state, "_delay_ready", None))
+        and callable(getattr(state, "_add_guild_from_data", None))
+    )
+
+
+def _get_session_path(shard_id: int) -> Path:
+    return config.get_data_path(f"gateway_session.{shard_id}.json")
+
+
+class GatewaySession:
+    def __init__(
+        self,
+        shard_id: int,
+        shard_count: int,
+        session_id: str,
+        sequence: int,
+        resume_url: str,
+        saved_at: Optional[float] = None,
+    ) -> None:
+        self.shard_id = shard_id
+        self.shard_count = shard_count
+        self.session_id = session_id
+        self.sequence = sequence
+        self.resume_url = resume_url
+        self.saved_at = time.time() if saved_at is None else saved_at
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "GatewaySession":
+        return cls(
+            data["shard_id"],
+            data["shard_count"],
+            data["session_id"],
+            data["sequence"],
+            data["resume_url"],
+            data["saved_at"],
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "shard_id": self.shard_id,
+            "shard_count": self.shard_count,
+            "session_id": self.session_id,
+            "sequence": self.sequence,
+            "resume_url": self.resume_url,
+            "saved_at": self.saved_at,
+        }
+
+    async def connect(self, bot: DpyBot) -> DiscordWebSocket:
+        return await DiscordWebSocket.from_client(
+            bot,
+            gateway=yarl.URL(self.resume_url),
+            shard_id=self.shard_id,
+            session=self.session_id,
+            sequence=self.sequence,
+            resume=True,
+        )
+
+
+class SessionStore:
+    """
+    Storage of gateway sessions that can be resumed after a restart.
+
+    Each shard's session is stored in a separate file so that cluster processes
+    sharing the data directory don't overwrite each other's sessions.
+    A stored session is only used once and only if it's at most `max_age`
+    seconds old, Discord invalidates sessions that weren't resumed in time.
+    Sessions of shards with more than `max_guilds` guilds aren't resumed,
+    restoring their guilds would take about as long as identifying.
+    """
+
+    def __init__(self, *, max_age: float = 60.0, max_guilds: int = 100) -> None:
+        self.max_age = max_age
+        self.max_guilds = max_guilds
+        # shard_id: guild IDs, the bot's guilds are only listed once for all shards
+        self._guild_ids: Optional[Dict[int, List[int]]] = None
+
+    @classmethod
+    def from_env(cls) -> Optional["SessionStore"]:
+        if not config.get_bool("DPYBOT_GATEWAY_RESUME", False):
+            return None
+        return cls(
+            max_age=config.get_float("DPYBOT_GATEWAY_RESUME_WINDOW", 60.0),
+            max_guilds=config.get_int("DPYBOT_GATEWAY_RESUME_MAX_GUILDS", 100),
+        )
+
+    def get_time_left(self, session: GatewaySession) -> float:
+        return self.max_age - (time.time() - session.saved_at)
+
+    async def get_guild_ids(self, bot: DpyBot, shard_id: int) -> List[int]:
+        if self._guild_ids is None:
+            shard_count = bot.shard_count or 1
+            guild_ids: Dict[int, List[int]] = {}
+            after: Optional[str] = None
+            while True:
+                page = await bot.http.get_guilds(200, after=after, with_counts=False)
+                for data in page:
+                    guild_id = int(data["id"])
+                    guild_ids.setdefault((guild_id >> 22) % shard_count, []).append(
+                        guild_id
+                    )
+                if len(page) < 200:
+                    break
+                after = page[-1]["id"]
+            self._guild_ids = guild_ids
+        return self._guild_ids.get(shard_id, [])
+
+    def save(self, session: GatewaySession) -> None:
+        path = _get_session_path(session.shard_id)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        with tmp_path.open("w", encoding="utf-8") as fp:
+            json.dump(session.to_dict(), fp, indent=4)
+        os.replace(tmp_path, path)
+
+    def pop(self, shard_id: int, shard_count: int) -> Optional[GatewaySession]:
+        path = _get_session_path(shard_id)
+        try:
+            with path.open(encoding="utf-8") as fp:
+                data = json.load(fp)
+        except FileNotFoundError:
+            return None
+        finally:
+            path.unlink(missing_ok=True)
+
+        session = GatewaySession.from_dict(data)
+        if session.shard_count != shard_count:
+            log.info(
+                "Not resuming the session of shard ID %s, the shard count changed.",
+                shard_id,
+            )
+            return None
+        age = time.time() - session.saved_at
+        if age > self.max_age:
+            log.info(
+                "Not resuming the session of shard ID %s, it was saved %.0fs ago.",
+                shard_id,
+                age,
+            )
+            return None
+        return session
+
+    async def suspend_shards(self, bot: DpyBot) -> None:
+        """Disconnect all shards without invalidating their sessions and save them."""
+        for shard_id, shard_info in bot.shards.items():
+            shard = shard_info._parent
+            ws = shard.ws
+            if ws.session_id is None or ws.sequence is None:
+                continue
+            # stop reading events so that the disconnect isn't handled as a failure
+            shard._cancel_task()
+            # Discord invalidates the session when closing with 1000 or 1001
+            await ws.close(code=4000)
+            self.save(
+                GatewaySession(
+                    shard_id,
+                    bot.shard_count or 1,
+                    ws.session_id,
+                    ws.sequence,
+                    str(ws.gateway),
+                )
+            )
+            log.info(
+                "Saved session %s of shard ID %s for resuming.", ws.session_id, shard_id
+            )
+
+
+async def _restore_guild(bot: DpyBot, guild_id: int) -> None:
+    http = bot.http
+    data, channels, me = await asyncio.gather(
+        http.get_guild(guild_id, with_counts=True),
+        http.get_all_guild_channels(guild_id),
+        http.get_member(guild_id, bot.user.id),  # type: ignore[union-attr]
+    )
+    guild_data: Dict[str, Any] = dict(data)
+    guild_data["channels"] = channels
+    guild_data["members"] = [me]
+    guild_data["member_count"] = data.get("approximate_member_count")
+    guild = bot._connection._add_guild_from_data(guild_data)  # type: ignore[arg-type]
+    bot.dispatch("guild_available", guild)
+
+
+async def restore_guilds(bot: DpyBot, shard_id: int, guild_ids: List[int]) -> None:
+    """
+    Fill the guild cache of a shard that's about to resume a session
+    from a previous process.
+
+    Discord only sends guilds in READY and the following GUILD_CREATE events,
+    which don't happen on resume, so they're fetched over the HTTP API instead.
+    This needs to happen before RESUME is sent so that the replayed events
+    get applied on top of the fetched state.
+    Only the guilds, their channels and the bot's own member are restored.
+    Threads, voice states and other members are cached as they show up in events,
+    like when guilds aren't chunked at startup.
+    """
+    started_at = time.perf_counter()
+    semaphore = asyncio.Semaphore(RESTORE_CONCURRENCY)
+
+    async def restore(guild_id: int) -> None:
+        async with semaphore:
+            try:
+                await _restore_guild(bot, guild_id)
+            except discord.HTTPException:
+                log.warning(
+                    "Failed to restore guild ID %s of shard ID %s.",
+                    guild_id,
+                    shard_id,
+                    exc_info=True,
+                )
+
+    await asyncio.gather(*(restore(guild_id) for guild_id in guild_ids))
+    log.info(
+        "Restored %s guilds of shard ID %s in %.2fs.",
+        len(guild_ids),
+        shard_id,
+        time.perf_counter() - started_at,
+    )
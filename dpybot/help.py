@@ -0,0 +1,104 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Hashable, List, Optional
+
+from discord.ext import commands
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+
+class HelpCache:
+    """LRU cache of rendered help pages."""
+
+    def __init__(self, max_size: int = 512) -> None:
+        self.max_size = max_size
+        self._pages: OrderedDict[Hashable, List[str]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[List[str]]:
+        pages = self._pages.get(key)
+        if pages is not None:
+            self._pages.move_to_end(key)
+        return pages
+
+    def set(self, key: Hashable, pages: List[str]) -> None:
+        self._pages[key] = pages
+        self._pages.move_to_end(key)
+        while len(self._pages) > self.max_size:
+            self._pages.popitem(last=False)
+
+    def clear(self) -> None:
+        self._pages.clear()
+
+
+class DpyHelpCommand(commands.DefaultHelpCommand):
+    """
+    Default help command with prerendered pages.
+
+    Pages are cached per command (or cog) and permission tier, i.e. whether
+    the user is an owner and, in guilds, the user's permissions in the channel.
+    The pages list only the commands whose checks pass, so checks that
+    depend on anything else may be reflected incorrectly until the cache
+    is cleared, which happens whenever a command is added or removed.
+    """
+
+    context: commands.Context[DpyBot]
+
+    def __init__(self, **options: Any) -> None:
+        super().__init__(**options)
+        self._rendering = False
+
+    async def _get_permission_tier(self) -> Hashable:
+        ctx = self.context
+        if self.verify_checks is False:
+            return None
+        if await ctx.bot.is_owner(ctx.author):
+            return "owner"
+        if ctx.guild is None:
+            return "dm"
+        return ctx.permissions.value
+
+    async def _send_cached(
+        self, name: str, render: Callable[..., Awaitable[None]], *args: Any
+    ) -> None:
+        ctx = self.context
+        # the ending note mentions the prefix and the name the help was invoked with
+        key = (
+            name,
+            await self._get_permission_tier(),
+            ctx.clean_prefix,
+            self.invoked_with,
+        )
+        help_cache = ctx.bot.help_cache
+        pages = help_cache.get(key)
+        if pages is None:
+            self._rendering = True
+            try:
+                await render(*args)
+            finally:
+                self._rendering = False
+            pages = list(self.paginator.pages)
+            help_cache.set(key, pages)
+        destination = self.get_destination()
+        for page in pages:
+            await destination.send(page)
+
+    async def send_pages(self) -> None:
+        # pages are sent by `_send_cached()` once they're rendered
+        if not self._rendering:
+            await super().send_pages()
+
+    async def send_bot_help(self, mapping: Any, /) -> None:
+        await self._send_cached("", super().send_bot_help, mapping)
+
+    async def send_cog_help(self, cog: commands.Cog, /) -> None:
+        await self._send_cached(f"cog:{cog.qualified_name}", super().send_cog_help, cog)
+
+    async def send_group_help(self, group: commands.Group, /) -> None:
+        await self._send_cached(group.qualified_name, super().send_group_help, group)
+
+    async def send_command_help(self, command: commands.Command, /) -> None:
+        await self._send_cached(
+            command.qualified_name, super().send_command_help, command
+        )
@@ -0,0 +1,224 @@
+from __future__ import annotations
+
+import asyncio
+import graphlib
+import sys
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+import discord
+from discord.ext import commands
+
+from dpybot import config, log
+from dpybot.tree_sync import sync_tree
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+_dpybot_folder = Path(__file__).absolute().parent
+PACKAGE_PARENTS = {
+    "dpybot.cogs": _dpybot_folder / "cogs",
+    "dpybot.ext_cogs": _dpybot_folder / "ext_cogs",
+}
+
+FileState = Dict[Path, Tuple[int, int]]
+
+
+def _scan(roots: List[Path]) -> FileState:
+    state = {}
+    for root in roots:
+        if not root.is_dir():
+            continue
+        for path in root.rglob("*.py"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            state[path] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def _get_changed_files(old: FileState, new: FileState) -> Set[Path]:
+    return {path for path in old.keys() | new.keys() if old.get(path) != new.get(path)}
+
+
+class HotReloader:
+    """
+    Watcher reloading cog packages when their files change.
+
+    Files are polled every `interval` seconds and once a change is noticed,
+    the watcher waits until there are no more changes for `debounce` seconds
+    so that e.g. a `git pull` or an ext manager update results in a single reload.
+
+    discord.py already purges the extension's submodules from `sys.modules` on reload
+    and restores the previous module objects if the reload fails. What it doesn't do
+    is reload other packages that use the changed one, which would keep references
+    to the old objects, so those are reloaded as well, after the changed package.
+    """
+
+    def __init__(
+        self, bot: DpyBot, *, interval: float = 1.0, debounce: float = 0.5
+    ) -> None:
+        self.bot = bot
+        self.interval = interval
+        self.debounce = debounce
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, bot: DpyBot) -> Optional["HotReloader"]:
+        if not config.get_bool("DPYBOT_HOT_RELOAD", False):
+            return None
+        return cls(
+            bot,
+            interval=config.get_float("DPYBOT_HOT_RELOAD_INTERVAL", 1.0),
+            debounce=config.get_float("DPYBOT_HOT_RELOAD_DEBOUNCE", 0.5),
+        )
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._watch())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _scan(self) -> FileState:
+        return await asyncio.to_thread(_scan, list(PACKAGE_PARENTS.values()))
+
+    async def _watch(self) -> None:
+        state = await self._scan()
+        while True:
+            await asyncio.sleep(self.interval)
+            new_state = await self._scan()
+            changed = _get_changed_files(state, new_state)
+            if not changed:
+                continue
+            # wait for the burst of changes to end
+            while True:
+                state = new_state
+                await asyncio.sleep(self.debounce)
+                new_state = await self._scan()
+                more_changes = _get_changed_files(state, new_state)
+                if not more_changes:
+                    break
+                changed |= more_changes
+            state = new_state
+            try:
+                await self.reload_changed(changed)
+            except Exception:
+                log.exception("Hot reload failed.")
+
+    def _get_package_name(self, path: Path) -> Optional[str]:
+        for root in PACKAGE_PARENTS.values():
+            try:
+                relative_path = path.relative_to(root)
+            except ValueError:
+                continue
+            if len(relative_path.parts) == 1:
+                # single-file extension
+                return relative_path.stem
+            return relative_path.parts[0]
+        return None
+
+    def _get_loaded_packages(self) -> Dict[str, str]:
+        # package_name: extension_name
+        packages = {}
+        for extension_name in self.bot.extensions:
+            parent, _, package_name = extension_name.rpartition(".")
+            if parent in PACKAGE_PARENTS:
+                packages[package_name] = extension_name
+        return packages
+
+    def get_dependency_graph(self) -> Dict[str, Set[str]]:
+        """Get the packages that each of the loaded packages uses."""
+        packages = self._get_loaded_packages()
+        module_owners = {}
+        for module_name in list(sys.modules):
+            for package_name, extension_name in packages.items():
+                if module_name == extension_name or module_name.startswith(
+                    f"{extension_name}."
+                ):
+                    module_owners[module_name] = package_name
+                    break
+
+        graph: Dict[str, Set[str]] = {package_name: set() for package_name in packages}
+        for module_name, package_name in module_owners.items():
+            module = sys.modules.get(module_name)
+            if module is None:
+                continue
+            # modules and objects imported from other packages
+            for value in list(vars(module).values()):
+                used_module = (
+                    value.__name__
+                    if isinstance(value, type(sys))
+                    else getattr(value, "__module__", None)
+                )
+                owner = module_owners.get(used_module) if used_module else None
+                if owner is not None and owner != package_name:
+                    graph[package_name].add(owner)
+        for package_name, extension_name in packages.items():
+            module = self.bot.extensions[extension_name]
+            for dependency in getattr(module, "DEPENDENCIES", ()):
+                if dependency in graph:
+                    graph[package_name].add(dependency)
+        return graph
+
+    def get_reload_order(self, changed_packages: Set[str]) -> List[str]:
+        graph = self.get_dependency_graph()
+        dependents: Dict[str, Set[str]] = {
+            package_name: set() for package_name in graph
+        }
+        for package_name, dependencies in graph.items():
+            for dependency in dependencies:
+                dependents[dependency].add(package_name)
+
+        affected = set()
+        pending = [
+            package_name for package_name in changed_packages if package_name in graph
+        ]
+        while pending:
+            package_name = pending.pop()
+            if package_name in affected:
+                continue
+            affected.add(package_name)
+            pending.extend(dependents[package_name])
+
+        sorter = graphlib.TopologicalSorter(
+            {package_name: graph[package_name] & affected for package_name in affected}
+        )
+        try:
+            return list(sorter.static_order())
+        except graphlib.CycleError:
+            log.warning("Cog packages depend on each other in a cycle: %s", affected)
+            return sorted(affected)
+
+    async def reload_changed(self, changed_files: Set[Path]) -> List[str]:
+        changed_packages = set()
+        for path in changed_files:
+            package_name = self._get_package_name(path)
+            if package_name is not None:
+                changed_packages.add(package_name)
+        order = self.get_reload_order(changed_packages)
+        if not order:
+            return []
+
+        log.info("Files changed, reloading cog packages: %s", ", ".join(order))
+        reloaded = []
+        for package_name in order:
+            try:
+                await self.bot.reload_package(package_name)
+            except commands.ExtensionError as exc:
+                # discord.py restores the previous version of the package on failure
+                log.error(
+                    "Cog package `%s` couldn't be reloaded, keeping the previous version.",
+                    package_name,
+                    exc_info=getattr(exc, "original", exc),
+                )
+            else:
+                reloaded.append(package_name)
+        if reloaded:
+            try:
+                await sync_tree(self.bot)
+            except discord.HTTPException:
+                log.exception("App command tree couldn't be synced after hot reload.")
+        return reloaded
@@ -0,0 +1,113 @@
+from types import ModuleType
+from typing import Any, Dict, Optional, Type, TypeVar
+
+import discord
+
+from dpybot import config
+
+FlagsT = TypeVar("FlagsT", discord.Intents, discord.MemberCacheFlags)
+
+# ballpark per-object memory cost (in bytes) used for the cache footprint estimate
+_ESTIMATED_SIZES = {
+    "guild": 6000,
+    "channel": 700,
+    "role": 600,
+    "member": 1100,
+    "user": 500,
+    "presence": 800,
+    "message": 2500,
+}
+
+
+def parse_flags(flags_cls: Type[FlagsT], value: str) -> FlagsT:
+    # each item is either a preset (`all`, `none`, `default`) that replaces
+    # the current value, a flag name to enable, or a `-`-prefixed flag name to disable
+    flags = flags_cls.none()
+    for item in value.split(","):
+        item = item.strip().lower()
+        if not item:
+            continue
+        if item in ("all", "none", "default"):
+            preset = getattr(flags_cls, item, None)
+            if preset is None:
+                raise ValueError(f"{flags_cls.__name__} has no `{item}` preset.")
+            flags = preset()
+            continue
+
+        enable = not item.startswith("-")
+        flag_name = item.lstrip("+-")
+        if flag_name not in flags_cls.VALID_FLAGS:
+            raise ValueError(f"`{flag_name}` is not a valid {flags_cls.__name__} flag.")
+        setattr(flags, flag_name, enable)
+
+    return flags
+
+
+def get_intents() -> discord.Intents:
+    return parse_flags(
+        discord.Intents, config.get_str("DPYBOT_INTENTS", "default,message_content")
+    )
+
+
+def get_member_cache_flags(
+    intents: discord.Intents,
+) -> Optional[discord.MemberCacheFlags]:
+    value = config.get_str("DPYBOT_MEMBER_CACHE_FLAGS")
+    if value is None or value.lower() == "from_intents":
+        return None
+    return parse_flags(discord.MemberCacheFlags, value)
+
+
+def get_cache_options() -> Dict[str, Any]:
+    intents = get_intents()
+    options: Dict[str, Any] = {
+        "intents": intents,
+        "max_messages": config.get_int("DPYBOT_MAX_MESSAGES", 1000),
+    }
+    member_cache_flags = get_member_cache_flags(intents)
+    if member_cache_flags is not None:
+        options["member_cache_flags"] = member_cache_flags
+    chunk_guilds_at_startup = config.get_bool("DPYBOT_CHUNK_GUILDS_AT_STARTUP")
+    if chunk_guilds_at_startup is not None:
+        options["chunk_guilds_at_startup"] = chunk_guilds_at_startup
+    return options
+
+
+def get_required_intents(module: ModuleType) -> discord.Intents:
+    # extensions can declare the intents they need
+    # with a module-level `REQUIRED_INTENTS` attribute
+    required_intents = getattr(module, "REQUIRED_INTENTS", None)
+    if required_intents is None:
+        return discord.Intents.none()
+    if not isinstance(required_intents, discord.Intents):
+        raise TypeError(
+            f"{module.__name__}.REQUIRED_INTENTS needs to be an instance"
+            f" of discord.Intents, not {type(required_intents)!r}"
+        )
+    return required_intents
+
+
+def format_flags(flags: Any) -> str:
+    enabled = [name for name, value in flags if value]
+    return ", ".join(enabled) if enabled else "(none)"
+
+
+def estimate_cache_footprint(bot: discord.Client) -> Dict[str, int]:
+    counts = {
+        "guild": len(bot.guilds),
+        "channel": 0,
+        "role": 0,
+        "member": 0,
+        "user": len(bot.users),
+        "presence": 0,
+        "message": len(bot.cached_messages),
+    }
+    for guild in bot.guilds:
+        counts["channel"] += len(guild.channels) + len(guild.threads)
+        counts["role"] += len(guild.roles)
+        counts["member"] += len(guild.members)
+        if bot.intents.presences:
+            counts["presence"] += sum(
+                1 for member in guild.members if member.activities
+            )
+    return {kind: count * _ESTIMATED_SIZES[kind] for kind, count in counts.items()}
@@ -0,0 +1,71 @@
+import asyncio
+import contextlib
+import time
+from typing import Dict, Iterator, Tuple
+
+from dpybot import log
+
+
+class InvocationTracker:
+    """
+    Tracker of in-flight command and interaction invocations.
+
+    Once `drain()` is called, the tracker is in drain mode and the bot stops
+    accepting new invocations, letting the tracked ones finish before it closes.
+    """
+
+    def __init__(self) -> None:
+        self.draining = False
+        # future resolved when the invocation finishes: task running the invocation
+        self._invocations: Dict[asyncio.Future, asyncio.Task] = {}
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._invocations)
+
+    @contextlib.contextmanager
+    def track(self) -> Iterator[None]:
+        task = asyncio.current_task()
+        assert task is not None
+        done = asyncio.get_running_loop().create_future()
+        self._invocations[done] = task
+        try:
+            yield
+        finally:
+            del self._invocations[done]
+            done.set_result(None)
+
+    async def drain(self, timeout: float) -> Tuple[int, int]:
+        """
+        Stop accepting new invocations and wait up to `timeout` seconds
+        for the in-flight ones, cancelling those that didn't finish in time.
+
+        The invocation that called this (e.g. the shutdown command) isn't waited for.
+        Returns the amounts of drained and cancelled invocations.
+        """
+        self.draining = True
+        current_task = asyncio.current_task()
+        invocations = {
+            done: task
+            for done, task in self._invocations.items()
+            if task is not current_task
+        }
+        if not invocations:
+            return 0, 0
+
+        log.info(
+            "Waiting up to %.1fs for %s in-flight invocations to finish...",
+            timeout,
+            len(invocations),
+        )
+        started_at = time.perf_counter()
+        drained, pending = await asyncio.wait(invocations, timeout=timeout)
+        for done in pending:
+            invocations[done].cancel()
+        log.info(
+            "Drained %s in-flight invocations in %.2fs, cancelled %s.",
+            len(drained),
+            time.perf_counter() - started_at,
+            len(pending),
+        )
+        return len(drained), len(pending)
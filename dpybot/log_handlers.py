@@ -0,0 +1,79 @@
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks the caller on DEBUG records.
+
+    Once the queue is filled past `high_water_mark`, DEBUG records get dropped
+    (and counted) instead of being queued. Records of higher levels are always
+    queued, blocking only if the queue is completely full.
+    """
+
+    def __init__(self, queue_: "queue.Queue[Any]", *, high_water_mark: float = 0.8):
+        super().__init__(queue_)
+        self._high_water_size = int(queue_.maxsize * high_water_mark)
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self._unreported_drops = 0
+
+    def _under_pressure(self) -> bool:
+        return self._high_water_size > 0 and self.queue.qsize() >= self._high_water_size
+
+    def _drop(self) -> None:
+        with self._lock:
+            self.dropped += 1
+            self._unreported_drops += 1
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if record.levelno <= logging.DEBUG and self._under_pressure():
+            self._drop()
+            return
+
+        if self._unreported_drops:
+            with self._lock:
+                dropped, self._unreported_drops = self._unreported_drops, 0
+            self.queue.put(
+                self.prepare(
+                    logging.makeLogRecord(
+                        {
+                            "name": __name__,
+                            "levelno": logging.WARNING,
+                            "levelname": "WARNING",
+                            "msg": "Dropped %s DEBUG log records (%s in total).",
+                            "args": (dropped, self.dropped),
+                        }
+                    )
+                )
+            )
+
+        if record.levelno <= logging.DEBUG:
+            try:
+                self.queue.put_nowait(record)
+            except queue.Full:
+                self._drop()
+        else:
+            self.queue.put(record)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for attr in ("process", "threadName", "taskName"):
+            value = getattr(record, attr, None)
+            if value is not None:
+                data[attr] = value
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
@@ -0,0 +1,109 @@
+import asyncio
+import collections
+import sys
+import threading
+import time
+import traceback
+from typing import Deque, Dict, Optional
+
+from dpybot import config, log
+
+
+class LoopLagMonitor:
+    """
+    Watchdog measuring how late the event loop runs scheduled callbacks.
+
+    A task on the event loop records the lag of each wake up. A separate thread
+    checks that the task keeps waking up and when the loop is stalled for longer
+    than `threshold`, it logs the stack that the loop's thread is stuck in,
+    along with the task that was running at that time.
+    """
+
+    def __init__(
+        self, *, interval: float = 0.25, threshold: float = 0.5, samples: int = 2400
+    ) -> None:
+        self.interval = interval
+        self.threshold = threshold
+        self.stall_count = 0
+        self._samples: Deque[float] = collections.deque(maxlen=samples)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._last_beat = 0.0
+        self._stall_reported = False
+
+    @classmethod
+    def from_env(cls) -> Optional["LoopLagMonitor"]:
+        if not config.get_bool("DPYBOT_LOOP_MONITOR", True):
+            return None
+        return cls(
+            interval=config.get_float("DPYBOT_LOOP_MONITOR_INTERVAL", 0.25),
+            threshold=config.get_float("DPYBOT_LOOP_LAG_THRESHOLD", 0.5),
+        )
+
+    def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = self._loop.create_task(self._beat())
+        self._thread = threading.Thread(
+            target=self._watch, name="dpybot-loop-monitor", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    async def _beat(self) -> None:
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = now - start - self.interval
+            self._samples.append(lag)
+            self._last_beat = now
+            if lag >= self.threshold:
+                self.stall_count += 1
+                log.warning("Event loop was blocked for %.3f seconds.", lag)
+            self._stall_reported = False
+
+    def _watch(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            stalled_for = time.monotonic() - self._last_beat - self.interval
+            if stalled_for < self.threshold or self._stall_reported:
+                continue
+            self._stall_reported = True
+            self._report_stall(stalled_for)
+
+    def _report_stall(self, stalled_for: float) -> None:
+        frame = sys._current_frames().get(self._loop_thread_id)  # type: ignore
+        stack = "".join(traceback.format_stack(frame)) if frame is not None else ""
+        task = asyncio.current_task(self._loop) if self._loop is not None else None
+        log.warning(
+            "Event loop has been blocked for %.3f seconds so far."
+            " Currently running task: %r\nStack of the event loop's thread:\n%s",
+            stalled_for,
+            task,
+            stack,
+        )
+
+    def get_percentiles(self) -> Dict[str, float]:
+        samples = sorted(self._samples)
+        if not samples:
+            return {}
+        last = len(samples) - 1
+        return {
+            "p50": samples[round(last * 0.5)],
+            "p90": samples[round(last * 0.9)],
+            "p99": samples[round(last * 0.99)],
+            "max": samples[last],
+        }
@@ -0,0 +1,292 @@
+from __future__ import annotations
+
+import logging
+import math
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from aiohttp import web
+
+from dpybot import config, log
+from dpybot.log_handlers import DroppingQueueHandler
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+LabelValues = Tuple[str, ...]
+
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value))
+
+
+def _escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            f'{name}="{_escape_label_value(value)}"'
+            for name, value in zip(names, values)
+        )
+        + "}"
+    )
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        # (suffix, extra label names, label values, value)
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        for suffix, extra_names, values, value in self._samples():
+            labels = _format_labels((*self.labelnames, *extra_names), values)
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def _samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        for labels, value in self._values.items():
+            yield "_total", (), labels, value
+
+
+class Gauge(_Metric):
+    """Gauge whose values are collected with a callback at render time."""
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        *,
+        collect: Callable[[], Dict[LabelValues, float]],
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.collect = collect
+
+    def _samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        for labels, value in self.collect().items():
+            yield "", (), labels, value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        *,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = (*sorted(buckets), math.inf)
+        # label values -> [per-bucket counts..., sum]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        try:
+            data = self._values[labels]
+        except KeyError:
+            data = self._values[labels] = [0.0] * (len(self.buckets) + 1)
+        for idx, bound in enumerate(self.buckets):
+            if value <= bound:
+                data[idx] += 1
+                break
+        data[-1] += value
+
+    def _samples(self) -> Iterable[Tuple[str, Sequence[str], Sequence[str], float]]:
+        for labels, data in self._values.items():
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                yield "_bucket", ("le",), (*labels, _format_value(bound)), cumulative
+            yield "_sum", (), labels, data[-1]
+            yield "_count", (), labels, cumulative
+
+
+class Metrics:
+    def __init__(self, bot: DpyBot) -> None:
+        self.bot = bot
+        self._runner: Optional[web.AppRunner] = None
+        self.command_latency = Histogram(
+            "dpybot_command_duration_seconds",
+            "Time spent invoking prefix commands.",
+            ("command", "status"),
+        )
+        self.command_prepare_time = Histogram(
+            "dpybot_command_prepare_duration_seconds",
+            "Time spent running checks and converters of prefix commands.",
+            ("command",),
+        )
+        self.check_duration = Histogram(
+            "dpybot_check_duration_seconds",
+            "Time spent running a command check or an interaction check.",
+            ("check", "command"),
+            buckets=(0.0001, 0.00025, 0.0005, *DEFAULT_BUCKETS),
+        )
+        self.app_command_latency = Histogram(
+            "dpybot_app_command_duration_seconds",
+            "Time between an interaction's creation and its app command completing.",
+            ("command", "status"),
+        )
+        self.events = Counter(
+            "dpybot_dispatched_events", "Dispatched events by type.", ("event",)
+        )
+        self.gateway_events = Counter(
+            "dpybot_gateway_events", "Received gateway events by type.", ("event",)
+        )
+        self._metrics: List[_Metric] = [
+            self.command_latency,
+            self.command_prepare_time,
+            self.check_duration,
+            self.app_command_latency,
+            self.events,
+            self.gateway_events,
+            Gauge(
+                "dpybot_gateway_latency_seconds",
+                "Gateway heartbeat latency of each shard.",
+                ("shard",),
+                collect=self._collect_gateway_latency,
+            ),
+            Gauge(
+                "dpybot_cache_size",
+                "Amount of objects in the bot's caches.",
+                ("cache",),
+                collect=self._collect_cache_sizes,
+            ),
+            Gauge(
+                "dpybot_event_loop_lag_seconds",
+                "Event loop lag percentiles.",
+                ("quantile",),
+                collect=self._collect_loop_lag,
+            ),
+            Gauge(
+                "dpybot_dropped_log_records",
+                "DEBUG log records dropped due to a full log queue.",
+                collect=self._collect_dropped_log_records,
+            ),
+        ]
+
+    def add_metric(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def _collect_gateway_latency(self) -> Dict[LabelValues, float]:
+        return {
+            (str(shard_id),): latency
+            for shard_id, latency in self.bot.latencies
+            if math.isfinite(latency)
+        }
+
+    def _collect_cache_sizes(self) -> Dict[LabelValues, float]:
+        guilds = self.bot.guilds
+        return {
+            ("guilds",): len(guilds),
+            ("users",): len(self.bot.users),
+            ("members",): sum(len(guild.members) for guild in guilds),
+            ("messages",): len(self.bot.cached_messages),
+        }
+
+    def _collect_loop_lag(self) -> Dict[LabelValues, float]:
+        if self.bot.loop_monitor is None:
+            return {}
+        quantiles = {"p50": "0.5", "p90": "0.9", "p99": "0.99", "max": "1"}
+        return {
+            (quantiles[name],): value
+            for name, value in self.bot.loop_monitor.get_percentiles().items()
+        }
+
+    def _collect_dropped_log_records(self) -> Dict[LabelValues, float]:
+        return {
+            (): handler.dropped
+            for handler in logging.getLogger().handlers
+            if isinstance(handler, DroppingQueueHandler)
+        }
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    async def start_server(self, host: str, port: int) -> None:
+        app = web.Application()
+        app.router.add_get("/metrics", self._handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        log.info("Metrics endpoint listening on http://%s:%s/metrics", host, port)
+
+    async def stop_server(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @classmethod
+    def get_server_address(cls) -> Optional[Tuple[str, int]]:
+        port = config.get_int("DPYBOT_METRICS_PORT")
+        if port is None:
+            return None
+        # each cluster gets its own port
+        port += config.get_int("DPYBOT_CLUSTER_ID", 0) or 0
+        return config.get_str("DPYBOT_METRICS_HOST", "127.0.0.1"), port
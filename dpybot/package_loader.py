@@ -0,0 +1,314 @@
+from __future__ import annotations
+
+import ast
+import asyncio
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import sys
+import time
+from pathlib import Path
+from types import ModuleType
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Dict,
+    Generator,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+)
+
+from discord.ext import commands
+
+from dpybot import log
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+
+class PackageLoadResult:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.extension_name: Optional[str] = None
+        self.dependencies: Sequence[str] = ()
+        self.import_time = 0.0
+        self.setup_time = 0.0
+        self.error: Optional[BaseException] = None
+        self.skip_reason: Optional[str] = None
+
+    @property
+    def status(self) -> str:
+        if self.error is not None:
+            return f"failed ({type(self.error).__name__})"
+        if self.skip_reason is not None:
+            return f"skipped ({self.skip_reason})"
+        return "loaded"
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.skip_reason is None
+
+
+def _get_dependencies(extension_name: str) -> Sequence[str]:
+    # packages can declare names of packages that need to be loaded before them
+    # with a module-level `DEPENDENCIES` attribute, it's read without importing
+    # the package so that its `__init__` only runs once, in `load_extension()`
+    spec = importlib.util.find_spec(extension_name)
+    if spec is None or spec.origin is None or not spec.has_location:
+        return ()
+    path = Path(spec.origin)
+    tree = ast.parse(path.read_bytes(), filename=str(path))
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            targets = node.targets
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            targets = [node.target]
+        else:
+            continue
+        if not any(
+            isinstance(target, ast.Name) and target.id == "DEPENDENCIES"
+            for target in targets
+        ):
+            continue
+        try:
+            dependencies = ast.literal_eval(node.value)  # type: ignore[arg-type]
+        except ValueError:
+            dependencies = None
+        if not isinstance(dependencies, (list, tuple)) or not all(
+            isinstance(name, str) for name in dependencies
+        ):
+            raise TypeError(
+                f"{extension_name}.DEPENDENCIES needs to be a literal sequence"
+                " of package names."
+            )
+        return tuple(dependencies)
+    return ()
+
+
+class _TimedSetup:
+    """
+    Awaitable running the `setup()` coroutine of a package.
+
+    Only the time spent running the coroutine's own steps is counted so that
+    the time spent waiting, and running other packages' setup concurrently,
+    isn't reported as this package's cost.
+    """
+
+    def __init__(self, awaitable: Awaitable[Any], result: PackageLoadResult) -> None:
+        self.awaitable = awaitable
+        self.result = result
+
+    def __await__(self) -> Generator[Any, Any, Any]:
+        steps = self.awaitable.__await__()
+        value: Any = None
+        error: Optional[BaseException] = None
+        while True:
+            start = time.perf_counter()
+            try:
+                if error is not None:
+                    yielded = steps.throw(error)
+                else:
+                    yielded = steps.send(value)
+            except StopIteration as exc:
+                return exc.value
+            finally:
+                self.result.setup_time += time.perf_counter() - start
+            try:
+                value = yield yielded
+                error = None
+            except BaseException as exc:
+                value = None
+                error = exc
+
+
+class _TimingLoader(importlib.abc.Loader):
+    """Loader timing the execution of a package's module and its `setup()`."""
+
+    def __init__(
+        self, spec: importlib.machinery.ModuleSpec, result: PackageLoadResult
+    ) -> None:
+        assert spec.loader is not None
+        self.spec = spec
+        self.loader = spec.loader
+        self.result = result
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.loader, name)
+
+    def create_module(self, spec: importlib.machinery.ModuleSpec) -> Any:
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module: ModuleType) -> None:
+        # the module shouldn't keep referencing this loader after it's loaded
+        self.spec.loader = module.__loader__ = self.loader
+        start = time.perf_counter()
+        try:
+            self.loader.exec_module(module)
+        finally:
+            self.result.import_time = time.perf_counter() - start
+
+        setup = getattr(module, "setup", None)
+        if setup is None:
+            return
+        result = self.result
+
+        def timed_setup(*args: Any) -> _TimedSetup:
+            module.setup = setup  # type: ignore[attr-defined]
+            return _TimedSetup(setup(*args), result)
+
+        module.setup = timed_setup  # type: ignore[attr-defined]
+
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """
+    Finder giving the packages loaded on startup a loader that times them.
+
+    `load_extension()` imports the package and calls its `setup()` in one go,
+    this lets their times be measured separately without relying on its internals.
+    """
+
+    def __init__(self, results: Dict[str, PackageLoadResult]) -> None:
+        # extension_name: result
+        self.results = results
+
+    def find_spec(
+        self, fullname: str, path: Any, target: Optional[ModuleType] = None
+    ) -> Optional[importlib.machinery.ModuleSpec]:
+        result = self.results.get(fullname)
+        if result is None:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        if spec.loader is not None:
+            spec.loader = _TimingLoader(spec, result)
+        return spec
+
+
+def _resolve_package(bot: DpyBot, result: PackageLoadResult) -> None:
+    try:
+        result.extension_name = bot.get_extension_name(result.name)
+        result.dependencies = _get_dependencies(result.extension_name)
+    except Exception as exc:
+        result.error = exc
+
+
+async def _load_package(bot: DpyBot, result: PackageLoadResult) -> None:
+    try:
+        await bot.load_package(result.name)
+    except Exception as exc:
+        result.error = exc
+
+
+def _get_next_batch(
+    bot: DpyBot,
+    pending: Dict[str, PackageLoadResult],
+    results: Dict[str, PackageLoadResult],
+) -> List[PackageLoadResult]:
+    batch = []
+    for result in list(pending.values()):
+        waiting = False
+        for dependency in result.dependencies:
+            if dependency in pending:
+                waiting = True
+            elif dependency in results:
+                if not results[dependency].ok:
+                    result.skip_reason = f"dependency {dependency} not loaded"
+                    break
+            elif not bot.is_package_loaded(dependency):
+                result.skip_reason = f"missing dependency {dependency}"
+                break
+        if result.skip_reason is not None:
+            del pending[result.name]
+        elif not waiting:
+            batch.append(result)
+    return batch
+
+
+async def _load_pending(
+    bot: DpyBot,
+    pending: Dict[str, PackageLoadResult],
+    results: Dict[str, PackageLoadResult],
+) -> None:
+    while pending:
+        pending_count = len(pending)
+        batch = _get_next_batch(bot, pending, results)
+        if not batch:
+            if len(pending) != pending_count:
+                # some packages got skipped, their dependents need to be re-checked
+                continue
+            for result in pending.values():
+                result.skip_reason = "dependency cycle"
+            break
+        for result in batch:
+            del pending[result.name]
+        # packages whose dependencies are all loaded get set up concurrently
+        await asyncio.gather(*(_load_package(bot, result) for result in batch))
+
+
+async def load_packages(bot: DpyBot, names: Iterable[str]) -> List[PackageLoadResult]:
+    results: Dict[str, PackageLoadResult] = {}
+    for name in names:
+        if name not in results:
+            results[name] = PackageLoadResult(name)
+
+    for result in results.values():
+        _resolve_package(bot, result)
+
+    pending = {name: result for name, result in results.items() if result.ok}
+    finder = _TimingFinder(
+        {result.extension_name: result for result in pending.values()}  # type: ignore[misc]
+    )
+    sys.meta_path.insert(0, finder)
+    try:
+        await _load_pending(bot, pending, results)
+    finally:
+        sys.meta_path.remove(finder)
+
+    for result in results.values():
+        if isinstance(result.error, commands.ExtensionNotFound):
+            log.error("Can't find package with name %s.", result.name)
+        elif result.error is not None:
+            log.error(
+                "Package %s couldn't be loaded.",
+                result.name,
+                exc_info=getattr(result.error, "original", result.error),
+            )
+        elif result.skip_reason is not None:
+            log.error("Package %s was skipped: %s", result.name, result.skip_reason)
+
+    return list(results.values())
+
+
+def format_load_results(results: Sequence[PackageLoadResult]) -> str:
+    rows = [("Package", "Import (ms)", "Setup (ms)", "Status")]
+    for result in results:
+        rows.append(
+            (
+                result.name,
+                f"{result.import_time * 1000:.1f}",
+                f"{result.setup_time * 1000:.1f}",
+                result.status,
+            )
+        )
+    rows.append(
+        (
+            "total",
+            f"{sum(result.import_time for result in results) * 1000:.1f}",
+            f"{sum(result.setup_time for result in results) * 1000:.1f}",
+            "",
+        )
+    )
+    widths = [max(len(row[idx]) for row in rows) for idx in range(len(rows[0]))]
+    return "\n".join(
+        "  ".join(cell.ljust(width) for cell, width in zip(row, widths)).rstrip()
+        for row in rows
+    )
@@ -0,0 +1,183 @@
+import json
+import re
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import discord
+from discord.ext import commands
+
+from dpybot import config
+
+
+class PrefixMatcher:
+    """Precompiled matcher for a set of prefixes."""
+
+    def __init__(self, prefixes: Sequence[str]) -> None:
+        self.prefixes = tuple(prefixes)
+        # longer prefixes need to go first so that e.g. `!!` isn't matched as `!`
+        pattern = "|".join(
+            re.escape(prefix) for prefix in sorted(set(prefixes), key=len, reverse=True)
+        )
+        self._match = re.compile(pattern).match if pattern else None
+
+    def match(self, content: str) -> Optional[str]:
+        if self._match is None:
+            return None
+        match = self._match(content)
+        return match.group() if match is not None else None
+
+
+class _GuildPrefixes:
+    def __init__(
+        self,
+        guild_prefixes: Optional[List[str]],
+        channel_prefixes: Dict[int, List[str]],
+    ) -> None:
+        self.guild_prefixes = guild_prefixes
+        self.channel_prefixes = channel_prefixes
+        self.matchers: Dict[Optional[int], PrefixMatcher] = {}
+
+
+class PrefixStore:
+    """SQLite storage of per-guild and per-channel prefixes."""
+
+    def __init__(self, path: str) -> None:
+        # queries are only ran on cache misses and changes,
+        # and they're fast enough to be ran directly on the event loop
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS prefixes ("
+            " guild_id INTEGER NOT NULL,"
+            " channel_id INTEGER NOT NULL,"
+            " prefixes TEXT NOT NULL,"
+            " PRIMARY KEY (guild_id, channel_id)"
+            ")"
+        )
+        self._conn.commit()
+
+    def get(self, guild_id: int) -> Tuple[Optional[List[str]], Dict[int, List[str]]]:
+        # channel_id is 0 for guild-wide prefixes
+        guild_prefixes = None
+        channel_prefixes = {}
+        rows = self._conn.execute(
+            "SELECT channel_id, prefixes FROM prefixes WHERE guild_id = ?",
+            (guild_id,),
+        )
+        for channel_id, prefixes in rows:
+            if channel_id == 0:
+                guild_prefixes = json.loads(prefixes)
+            else:
+                channel_prefixes[channel_id] = json.loads(prefixes)
+        return guild_prefixes, channel_prefixes
+
+    def set(self, guild_id: int, channel_id: int, prefixes: Sequence[str]) -> None:
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO prefixes (guild_id, channel_id, prefixes)"
+                " VALUES (?, ?, ?)",
+                (guild_id, channel_id, json.dumps(list(prefixes))),
+            )
+
+    def clear(self, guild_id: int, channel_id: int) -> None:
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM prefixes WHERE guild_id = ? AND channel_id = ?",
+                (guild_id, channel_id),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+class PrefixManager:
+    def __init__(self, default_prefixes: Sequence[str], cache_size: int) -> None:
+        self.default_prefixes = list(default_prefixes)
+        self.cache_size = cache_size
+        self._store = PrefixStore(str(config.get_data_path("prefixes.sqlite3")))
+        self._cache: "OrderedDict[int, _GuildPrefixes]" = OrderedDict()
+        self._default_matcher: Optional[PrefixMatcher] = None
+        self._mentions: List[str] = []
+
+    @classmethod
+    def from_env(cls) -> "PrefixManager":
+        return cls(
+            [config.get_str("DPYBOT_PREFIX", "===")],
+            config.get_int("DPYBOT_PREFIX_CACHE_SIZE", 1000) or 0,
+        )
+
+    def _get_guild_prefixes(self, guild_id: int) -> _GuildPrefixes:
+        try:
+            entry = self._cache[guild_id]
+        except KeyError:
+            entry = _GuildPrefixes(*self._store.get(guild_id))
+            self._cache[guild_id] = entry
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        else:
+            self._cache.move_to_end(guild_id)
+        return entry
+
+    def get_prefixes(
+        self, guild_id: Optional[int], channel_id: Optional[int] = None
+    ) -> List[str]:
+        if guild_id is None:
+            return self.default_prefixes
+        entry = self._get_guild_prefixes(guild_id)
+        if channel_id is not None and channel_id in entry.channel_prefixes:
+            return entry.channel_prefixes[channel_id]
+        if entry.guild_prefixes is not None:
+            return entry.guild_prefixes
+        return self.default_prefixes
+
+    def _make_matcher(self, prefixes: Sequence[str]) -> PrefixMatcher:
+        return PrefixMatcher([*self._mentions, *prefixes])
+
+    def get_matcher(
+        self, guild_id: Optional[int], channel_id: Optional[int]
+    ) -> PrefixMatcher:
+        if guild_id is None:
+            if self._default_matcher is None:
+                self._default_matcher = self._make_matcher(self.default_prefixes)
+            return self._default_matcher
+
+        entry = self._get_guild_prefixes(guild_id)
+        key = channel_id if channel_id in entry.channel_prefixes else None
+        try:
+            return entry.matchers[key]
+        except KeyError:
+            matcher = self._make_matcher(self.get_prefixes(guild_id, channel_id))
+            entry.matchers[key] = matcher
+            return matcher
+
+    def set_user_id(self, user_id: int) -> None:
+        mentions = [f"<@{user_id}> ", f"<@!{user_id}> "]
+        if mentions != self._mentions:
+            self._mentions = mentions
+            self._default_matcher = None
+            for entry in self._cache.values():
+                entry.matchers.clear()
+
+    def set_prefixes(
+        self, guild_id: int, channel_id: Optional[int], prefixes: Sequence[str]
+    ) -> None:
+        self._store.set(guild_id, channel_id or 0, prefixes)
+        self._cache.pop(guild_id, None)
+
+    def clear_prefixes(self, guild_id: int, channel_id: Optional[int]) -> None:
+        self._store.clear(guild_id, channel_id or 0)
+        self._cache.pop(guild_id, None)
+
+    async def __call__(self, bot: commands.Bot, message: discord.Message) -> List[str]:
+        # This returns either the matched prefix or nothing so that d.py doesn't
+        # have to go through the whole list of prefixes again.
+        # Messages without a prefix (which is most of them) get rejected
+        # with a single regex match.
+        if bot.user is not None and not self._mentions:
+            self.set_user_id(bot.user.id)
+        guild_id = message.guild.id if message.guild is not None else None
+        prefix = self.get_matcher(guild_id, message.channel.id).match(message.content)
+        return [prefix] if prefix is not None else []
+
+    def close(self) -> None:
+        self._store.close()
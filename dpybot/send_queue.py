@@ -0,0 +1,264 @@
+import asyncio
+import contextlib
+import contextvars
+import enum
+import heapq
+import itertools
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+import discord
+
+from dpybot import config
+from dpybot.metrics import Counter, Gauge, LabelValues
+
+# Discord's message length limit
+MAX_MESSAGE_LENGTH = 2000
+# messages sent with any other keyword arguments are never coalesced
+_COALESCABLE_KWARGS = frozenset({"allowed_mentions", "silent", "suppress_embeds"})
+# whether the current task already holds a send slot
+_holding_slot: contextvars.ContextVar[bool] = contextvars.ContextVar(
+    "_holding_slot", default=False
+)
+
+
+class Priority(enum.IntEnum):
+    INTERACTION = 0
+    COMMAND = 1
+    BULK = 2
+
+
+class PrioritySemaphore:
+    """Semaphore that wakes up waiters with the lowest priority value first."""
+
+    def __init__(self, value: int) -> None:
+        self._value = value
+        # (priority, sequence number, future)
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    @contextlib.asynccontextmanager
+    async def acquire(self, priority: int) -> AsyncIterator[None]:
+        if self._value > 0 and not self._waiters:
+            self._value -= 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._counter), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # the slot was handed over right before the cancellation
+                if future.done() and not future.cancelled():
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def _release(self) -> None:
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._value += 1
+
+
+class _PendingMessage:
+    __slots__ = ("priority", "sequence", "content", "kwargs", "coalesce", "future")
+
+    def __init__(
+        self,
+        priority: Priority,
+        sequence: int,
+        content: Optional[str],
+        kwargs: Dict[str, Any],
+        coalesce: bool,
+    ) -> None:
+        self.priority = priority
+        self.sequence = sequence
+        self.content = content
+        self.kwargs = kwargs
+        self.coalesce = (
+            coalesce and content is not None and kwargs.keys() <= _COALESCABLE_KWARGS
+        )
+        self.future: asyncio.Future[discord.Message] = (
+            asyncio.get_running_loop().create_future()
+        )
+
+    def __lt__(self, other: "_PendingMessage") -> bool:
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    def can_coalesce_with(self, other: "_PendingMessage", length: int) -> bool:
+        return (
+            other.coalesce
+            and other.priority == self.priority
+            and other.kwargs == self.kwargs
+            # +1 for the newline joining them
+            and length + 1 + len(other.content or "") <= MAX_MESSAGE_LENGTH
+        )
+
+
+class SendQueue:
+    """
+    Scheduler of outbound messages.
+
+    Each channel has its own queue and worker sending its messages one at a time
+    so that a burst of messages to a single channel waits in the queue rather than
+    on discord.py's rate limit lock, where consecutive small messages can be
+    coalesced into one when the callers allowed it. Sends to all channels share
+    a limited amount of slots that are handed out by priority, letting
+    interaction responses skip ahead of bulk sends.
+    """
+
+    def __init__(self, *, max_concurrency: int = 25) -> None:
+        self._slots = PrioritySemaphore(max_concurrency)
+        # channel ID: heap of pending messages
+        self._queues: Dict[int, List[_PendingMessage]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._counter = itertools.count()
+        self.rate_limited = Counter(
+            "dpybot_http_rate_limited",
+            "HTTP responses with the 429 status code.",
+            ("scope",),
+        )
+        self.coalesced = Counter(
+            "dpybot_send_queue_coalesced_messages",
+            "Messages that were sent as part of another message.",
+        )
+        self.queue_depth = Gauge(
+            "dpybot_send_queue_depth",
+            "Messages waiting in the outbound queue.",
+            ("priority",),
+            collect=self._collect_queue_depth,
+        )
+
+    @classmethod
+    def from_env(cls) -> "SendQueue":
+        return cls(max_concurrency=config.get_int("DPYBOT_SEND_CONCURRENCY", 25))
+
+    def create_trace_config(self) -> aiohttp.TraceConfig:
+        async def on_request_end(
+            session: aiohttp.ClientSession,
+            context: Any,
+            params: aiohttp.TraceRequestEndParams,
+        ) -> None:
+            if params.response.status == 429:
+                self.rate_limited.inc(
+                    params.response.headers.get("X-RateLimit-Scope", "unknown")
+                )
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_end.append(on_request_end)
+        return trace_config
+
+    def _collect_queue_depth(self) -> Dict[LabelValues, float]:
+        depth = {(priority.name.lower(),): 0.0 for priority in Priority}
+        for queue in self._queues.values():
+            for pending in queue:
+                depth[(pending.priority.name.lower(),)] += 1
+        return depth
+
+    @property
+    def depth(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @contextlib.asynccontextmanager
+    async def slot(self, priority: Priority) -> AsyncIterator[None]:
+        """
+        Hold one of the send slots, e.g. while responding to an interaction.
+
+        A task that already holds a slot keeps using it rather than waiting
+        for another one.
+        """
+        if _holding_slot.get():
+            yield
+            return
+        async with self._slots.acquire(priority):
+            token = _holding_slot.set(True)
+            try:
+                yield
+            finally:
+                _holding_slot.reset(token)
+
+    async def send(
+        self,
+        destination: discord.abc.Messageable,
+        content: Optional[Any] = None,
+        *,
+        coalesce: bool = False,
+        priority: Priority = Priority.COMMAND,
+        **kwargs: Any,
+    ) -> discord.Message:
+        """
+        Queue a message to be sent to the given destination.
+
+        With `coalesce`, a text-only message can be sent as part of a single message
+        along with other consecutive messages to the same channel that also allow it,
+        in which case all of them return the same `discord.Message`.
+        """
+        channel = await destination._get_channel()
+        pending = _PendingMessage(
+            priority,
+            next(self._counter),
+            str(content) if content is not None else None,
+            kwargs,
+            coalesce,
+        )
+        queue = self._queues.setdefault(channel.id, [])
+        heapq.heappush(queue, pending)
+        if channel.id not in self._workers:
+            self._workers[channel.id] = asyncio.create_task(
+                self._run_worker(channel.id, channel)
+            )
+        return await pending.future
+
+    async def _run_worker(
+        self, channel_id: int, channel: discord.abc.Messageable
+    ) -> None:
+        queue = self._queues[channel_id]
+        try:
+            while queue:
+                pending = heapq.heappop(queue)
+                batch = [pending]
+                if pending.coalesce:
+                    length = len(pending.content or "")
+                    while queue and pending.can_coalesce_with(queue[0], length):
+                        other = heapq.heappop(queue)
+                        length += 1 + len(other.content or "")
+                        batch.append(other)
+                # skip messages whose senders were cancelled
+                batch = [item for item in batch if not item.future.done()]
+                if not batch:
+                    continue
+                content = "\n".join(
+                    item.content for item in batch if item.content is not None
+                )
+                try:
+                    async with self._slots.acquire(pending.priority):
+                        message = await channel.send(content or None, **pending.kwargs)
+                except Exception as exc:
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_exception(exc)
+                else:
+                    self.coalesced.inc(amount=len(batch) - 1)
+                    for item in batch:
+                        if not item.future.done():
+                            item.future.set_result(message)
+        finally:
+            del self._workers[channel_id]
+            if not queue:
+                del self._queues[channel_id]
+
+    async def close(self) -> None:
+        workers = list(self._workers.values())
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for queue in self._queues.values():
+            for pending in queue:
+                if not pending.future.done():
+                    pending.future.cancel()
+        self._queues.clear()
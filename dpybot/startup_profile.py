@@ -0,0 +1,155 @@
+import asyncio
+import cProfile
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import discord
+
+from dpybot import log
+from dpybot.bot import DpyBot
+from dpybot.tree_sync import get_tree_payload
+
+
+def measure_import_time(
+    artifact_path: Optional[Path] = None,
+) -> Tuple[float, List[Dict[str, Any]]]:
+    # `dpybot` is already imported in this process so the import
+    # has to be measured in a fresh interpreter
+    proc = subprocess.run(
+        (sys.executable, "-X", "importtime", "-c", "import dpybot.bot"),
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+    )
+    if artifact_path is not None:
+        artifact_path.write_text(proc.stderr, encoding="utf-8")
+
+    modules = []
+    total = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        modules.append(
+            {
+                "module": name.strip(),
+                "self_time": int(self_us) / 1_000_000,
+                "cumulative_time": int(cumulative_us) / 1_000_000,
+            }
+        )
+        # top-level imports aren't indented
+        if not name.startswith("  "):
+            total += int(cumulative_us)
+    modules.sort(key=lambda module: module["self_time"], reverse=True)
+    return total / 1_000_000, modules[:20]
+
+
+async def _profile_bot() -> Dict[str, Any]:
+    start = time.perf_counter()
+    bot = DpyBot(force_sync=True)
+    bot_init_time = time.perf_counter() - start
+
+    # stub out everything that needs the HTTP API
+    bot._connection.application_id = 0
+
+    async def sync(*, guild: Any = None) -> List[Any]:
+        return []
+
+    bot.tree.sync = sync  # type: ignore[assignment]
+    # this is what `Client.login()` does right before calling `setup_hook()`
+    await bot._async_setup_hook()
+
+    start = time.perf_counter()
+    await bot.setup_hook()
+    setup_hook_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    await get_tree_payload(bot.tree)
+    for guild_id in bot.tree._guild_commands:
+        await get_tree_payload(bot.tree, guild=discord.Object(guild_id))
+    tree_construction_time = time.perf_counter() - start
+
+    report = {
+        "bot_init_time": bot_init_time,
+        "setup_hook_time": setup_hook_time,
+        "cog_load_time": sum(
+            result.import_time + result.setup_time
+            for result in bot.package_load_results
+        ),
+        "tree_construction_time": tree_construction_time,
+        "packages": [
+            {
+                "name": result.name,
+                "import_time": result.import_time,
+                "setup_time": result.setup_time,
+                "status": result.status,
+            }
+            for result in bot.package_load_results
+        ],
+        "app_command_count": len(bot.tree.get_commands()),
+        "command_count": len(bot.commands),
+    }
+    await bot.close()
+    return report
+
+
+def profile_startup(
+    output_dir: Path, *, save_artifacts: bool = False
+) -> Dict[str, Any]:
+    output_dir.mkdir(parents=True, exist_ok=True)
+    import_time, slowest_imports = measure_import_time(
+        output_dir / "importtime.txt" if save_artifacts else None
+    )
+
+    profiler = cProfile.Profile() if save_artifacts else None
+    # the data dir is used by the tree sync, keep it away from the real one
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["DPYBOT_DATA_DIR"] = data_dir
+        if profiler is not None:
+            profiler.enable()
+        try:
+            report = asyncio.run(_profile_bot())
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            del os.environ["DPYBOT_DATA_DIR"]
+    if profiler is not None:
+        profiler.dump_stats(str(output_dir / "startup.prof"))
+
+    report["import_time"] = import_time
+    report["slowest_imports"] = slowest_imports
+    with (output_dir / "report.json").open("w", encoding="utf-8") as fp:
+        json.dump(report, fp, indent=4)
+    return report
+
+
+def format_report(report: Dict[str, Any]) -> str:
+    lines = [
+        f"Import time: {report['import_time'] * 1000:.1f} ms",
+        f"Bot construction time: {report['bot_init_time'] * 1000:.1f} ms",
+        f"setup_hook() time: {report['setup_hook_time'] * 1000:.1f} ms",
+        f"  cog load time: {report['cog_load_time'] * 1000:.1f} ms",
+        f"Tree construction time: {report['tree_construction_time'] * 1000:.1f} ms",
+        "Packages:",
+    ]
+    for package in report["packages"]:
+        lines.append(
+            f"  {package['name']}: import {package['import_time'] * 1000:.1f} ms,"
+            f" setup {package['setup_time'] * 1000:.1f} ms ({package['status']})"
+        )
+    lines.append("Slowest imports (self time):")
+    for module in report["slowest_imports"][:10]:
+        lines.append(f"  {module['module']}: {module['self_time'] * 1000:.1f} ms")
+    return "\n".join(lines)
+
+
+def run_startup_profile(output_dir: Path, *, save_artifacts: bool = False) -> None:
+    report = profile_startup(output_dir, save_artifacts=save_artifacts)
+    print(format_report(report))
+    log.info("Startup profile written to %s", output_dir)
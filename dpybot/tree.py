@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict, Set, Union
+
+import discord
+from discord import app_commands
+
+from dpybot import config, log
+from dpybot.auto_defer import AutoDeferResponse
+from dpybot.checks import instrument_command
+from dpybot.metrics import Counter
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+
+def get_interaction_command_name(data: Dict[str, Any]) -> str:
+    # qualified name of the invoked command, e.g. `groupcog subgroup command`
+    parts = [data["name"]]
+    options = data.get("options", [])
+    while options:
+        option = options[0]
+        # subcommand or subcommand group
+        if option["type"] not in (1, 2):
+            break
+        parts.append(option["name"])
+        options = option.get("options", [])
+    return " ".join(parts)
+
+
+class DpyTree(app_commands.CommandTree["DpyBot"]):
+    def __init__(self, client: DpyBot, **kwargs: Any) -> None:
+        super().__init__(client, **kwargs)
+        # seconds since receiving an interaction after which it's deferred
+        # if the command didn't respond yet, Discord only waits for 3 seconds
+        self.auto_defer_budget = config.get_float("DPYBOT_AUTO_DEFER_BUDGET", 2.0)
+        self.auto_defer_ephemeral = config.get_bool(
+            "DPYBOT_AUTO_DEFER_EPHEMERAL", False
+        )
+        self._auto_defer_tasks: Set[asyncio.Task] = set()
+        self.auto_defers = Counter(
+            "dpybot_app_command_auto_defers",
+            "App command interactions that had to be deferred automatically.",
+            ("command",),
+        )
+
+    def add_command(
+        self,
+        command: Union[
+            app_commands.Command[Any, ..., Any],
+            app_commands.ContextMenu,
+            app_commands.Group,
+        ],
+        /,
+        **kwargs: Any,
+    ) -> None:
+        super().add_command(command, **kwargs)
+        metrics = self.client.metrics
+        if metrics is not None:
+            instrument_command(command, metrics.check_duration)
+
+    async def _call(self, interaction: discord.Interaction[DpyBot]) -> None:
+        invocations = self.client.invocations
+        if invocations.draining:
+            if interaction.type is discord.InteractionType.application_command:
+                await interaction.response.send_message(
+                    "The bot is shutting down, try again in a moment.", ephemeral=True
+                )
+            return
+        with invocations.track():
+            await self._deferring_call(interaction)
+
+    async def _deferring_call(self, interaction: discord.Interaction[DpyBot]) -> None:
+        if (
+            not self.auto_defer_budget
+            or interaction.type is not discord.InteractionType.application_command
+        ):
+            await self._profiled_call(interaction)
+            return
+
+        # the slot backing `Interaction.response`
+        interaction._cs_response = AutoDeferResponse(interaction)  # type: ignore
+        # Discord's 3 seconds start when the interaction is created,
+        # gateway and event processing latency count towards them too
+        age = (discord.utils.utcnow() - interaction.created_at).total_seconds()
+        handle = asyncio.get_running_loop().call_later(
+            max(0.0, self.auto_defer_budget - age),
+            self._start_auto_defer,
+            interaction,
+        )
+        try:
+            await self._profiled_call(interaction)
+        finally:
+            handle.cancel()
+
+    def _start_auto_defer(self, interaction: discord.Interaction[DpyBot]) -> None:
+        task = asyncio.create_task(self._auto_defer(interaction))
+        self._auto_defer_tasks.add(task)
+        task.add_done_callback(self._auto_defer_tasks.discard)
+
+    async def _auto_defer(self, interaction: discord.Interaction[DpyBot]) -> None:
+        command = interaction.command
+        extras = command.extras if command is not None else {}
+        # e.g. commands responding with a modal can't be deferred
+        if not extras.get("auto_defer", True):
+            return
+        ephemeral = extras.get("auto_defer_ephemeral", self.auto_defer_ephemeral)
+        response: AutoDeferResponse = interaction.response  # type: ignore
+        try:
+            deferred = await response.auto_defer(ephemeral=ephemeral)
+        except discord.HTTPException:
+            log.exception("Failed to defer interaction automatically.")
+            return
+        if deferred:
+            command_name = get_interaction_command_name(
+                interaction.data  # type: ignore[arg-type]
+            )
+            self.auto_defers.inc(command_name)
+            log.debug(
+                "Deferred %s automatically %.2f seconds after it was created.",
+                command_name,
+                (discord.utils.utcnow() - interaction.created_at).total_seconds(),
+            )
+
+    async def _profiled_call(self, interaction: discord.Interaction[DpyBot]) -> None:
+        profiler = self.client.command_profiler
+        if profiler.is_running and profiler.should_profile(
+            get_interaction_command_name(interaction.data)  # type: ignore[arg-type]
+        ):
+            with profiler.profile():
+                await super()._call(interaction)
+        else:
+            await super()._call(interaction)
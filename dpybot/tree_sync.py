@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+import discord
+from discord import app_commands
+
+from dpybot import config, log
+
+if TYPE_CHECKING:
+    from dpybot.bot import DpyBot
+
+
+SYNC_STATE_FILE = "tree_sync_state.json"
+GLOBAL_SCOPE = "global"
+
+
+def _get_scope(guild: Optional[discord.abc.Snowflake]) -> str:
+    return GLOBAL_SCOPE if guild is None else str(guild.id)
+
+
+async def get_tree_payload(
+    tree: app_commands.CommandTree, *, guild: Optional[discord.abc.Snowflake] = None
+) -> List[Dict[str, Any]]:
+    # this mirrors how `CommandTree.sync()` builds the payload it sends to Discord
+    commands = tree._get_all_commands(guild=guild)
+    translator = tree.translator
+    if translator:
+        return [
+            await command.get_translated_payload(tree, translator)
+            for command in commands
+        ]
+    return [command.to_dict(tree) for command in commands]
+
+
+# diffs with more operations than this are pushed with a single bulk overwrite,
+# each command upsert or delete is a separate request against the rate limit
+BULK_SYNC_THRESHOLD = 5
+
+# {"commands": {command_key: {"id": str, "hash": str}}}
+ScopeState = Dict[str, Any]
+
+
+def _get_command_key(command: Dict[str, Any]) -> str:
+    return f"{command.get('type', 1)}:{command['name']}"
+
+
+def hash_command(command: Dict[str, Any]) -> str:
+    data = json.dumps(command, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+class TreeDiff:
+    def __init__(
+        self,
+        scope: str,
+        *,
+        added: Dict[str, Dict[str, Any]],
+        changed: Dict[str, Dict[str, Any]],
+        removed: Dict[str, str],
+        full: bool = False,
+    ) -> None:
+        self.scope = scope
+        # command_key: payload
+        self.added = added
+        self.changed = changed
+        # command_key: command_id
+        self.removed = removed
+        # whether the whole scope needs to be overwritten,
+        # e.g. because its remote state isn't known
+        self.full = full
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.full or self.added or self.changed or self.removed)
+
+    @property
+    def operation_count(self) -> int:
+        return len(self.added) + len(self.changed) + len(self.removed)
+
+    def format(self) -> str:
+        lines = [f"# scope {self.scope}"]
+        if self.full:
+            lines.append("! full sync")
+        lines.extend(f"+ {key}" for key in sorted(self.added))
+        lines.extend(f"! {key}" for key in sorted(self.changed))
+        lines.extend(f"- {key}" for key in sorted(self.removed))
+        if len(lines) == 1:
+            lines.append("  up to date")
+        return "\n".join(lines)
+
+
+def diff_payload(
+    scope: str, payload: List[Dict[str, Any]], scope_state: Optional[ScopeState]
+) -> TreeDiff:
+    local = {_get_command_key(command): command for command in payload}
+    # scopes that weren't synced yet
+    if scope_state is None:
+        return TreeDiff(scope, added=local, changed={}, removed={}, full=True)
+    synced = scope_state["commands"]
+    return TreeDiff(
+        scope,
+        added={key: command for key, command in local.items() if key not in synced},
+        changed={
+            key: command
+            for key, command in local.items()
+            if key in synced and synced[key]["hash"] != hash_command(command)
+        },
+        removed={
+            key: command_state["id"]
+            for key, command_state in synced.items()
+            if key not in local
+        },
+    )
+
+
+def load_sync_state() -> Dict[str, Dict[str, Any]]:
+    # application_id: {scope: ScopeState}
+    path = config.get_data_path(SYNC_STATE_FILE)
+    if not path.exists():
+        return {}
+    with path.open(encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def write_sync_state(sync_state: Dict[str, Dict[str, Any]]) -> None:
+    path = config.get_data_path(SYNC_STATE_FILE)
+    # unique per process as cluster processes share the data directory
+    tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as fp:
+        json.dump(sync_state, fp, indent=4)
+    os.replace(tmp_path, path)
+
+
+async def _bulk_sync(
+    bot: DpyBot,
+    guild: Optional[discord.abc.Snowflake],
+    payload: List[Dict[str, Any]],
+) -> ScopeState:
+    app_commands_list = await bot.tree.sync(guild=guild)
+    ids = {
+        f"{app_command.type.value}:{app_command.name}": str(app_command.id)
+        for app_command in app_commands_list
+    }
+    return {
+        "commands": {
+            _get_command_key(command): {
+                "id": ids.get(_get_command_key(command)),
+                "hash": hash_command(command),
+            }
+            for command in payload
+        },
+    }
+
+
+async def _incremental_sync(
+    bot: DpyBot,
+    guild: Optional[discord.abc.Snowflake],
+    diff: TreeDiff,
+    scope_state: ScopeState,
+) -> None:
+    # `scope_state` is updated after each request so that
+    # it reflects what was pushed even if one of the requests fails
+    http = bot.http
+    application_id = bot.application_id
+    commands = scope_state["commands"]
+    for key, command_id in diff.removed.items():
+        if guild is None:
+            await http.delete_global_command(application_id, command_id)
+        else:
+            await http.delete_guild_command(application_id, guild.id, command_id)
+        del commands[key]
+    # upserting a command with an existing name overwrites it
+    # which, unlike editing it, doesn't drop fields such as permissions
+    for key, command in {**diff.added, **diff.changed}.items():
+        if guild is None:
+            data = await http.upsert_global_command(application_id, command)
+        else:
+            data = await http.upsert_guild_command(application_id, guild.id, command)
+        commands[key] = {"id": data["id"], "hash": hash_command(command)}
+
+
+async def sync_tree(
+    bot: DpyBot, *, force: bool = False, dry_run: bool = False
+) -> List[TreeDiff]:
+    """
+    Push changes in the app command tree to Discord.
+
+    Only the commands that were added, changed or removed since the last sync
+    are pushed, unless there are more changes than `BULK_SYNC_THRESHOLD`
+    or `force` is set, in which case the whole tree for that scope is overwritten.
+    With `dry_run`, nothing is pushed and only the diffs are returned.
+    """
+    application_id = str(bot.application_id)
+    sync_state = load_sync_state()
+    app_state = sync_state.setdefault(application_id, {})
+
+    guild_ids = set(bot.tree._guild_commands)
+    # guilds that were synced before but no longer have any commands
+    # need to be synced one more time to remove them
+    guild_ids.update(int(scope) for scope in app_state if scope != GLOBAL_SCOPE)
+    guilds: List[Optional[discord.abc.Snowflake]] = [None]
+    guilds.extend(discord.Object(guild_id) for guild_id in sorted(guild_ids))
+
+    diffs = []
+    for guild in guilds:
+        scope = _get_scope(guild)
+        payload = await get_tree_payload(bot.tree, guild=guild)
+        scope_state = app_state.get(scope)
+        diff = diff_payload(scope, payload, scope_state)
+        if force:
+            diff.full = True
+        diffs.append(diff)
+        if dry_run:
+            continue
+        if diff.is_empty:
+            log.info(
+                "App command tree for scope %s is up to date, skipping sync.", scope
+            )
+            continue
+
+        try:
+            if diff.full or diff.operation_count > BULK_SYNC_THRESHOLD:
+                app_state[scope] = await _bulk_sync(bot, guild, payload)
+                log.info("Synced app command tree for scope %s.", scope)
+            else:
+                assert scope_state is not None
+                await _incremental_sync(bot, guild, diff, scope_state)
+                log.info(
+                    "Synced %s app command change(s) for scope %s.",
+                    diff.operation_count,
+                    scope,
+                )
+        finally:
+            scope_state = app_state.get(scope)
+            if (
+                guild is not None
+                and scope_state is not None
+                and not scope_state["commands"]
+            ):
+                app_state.pop(scope, None)
+            write_sync_state(sync_state)
+    return diffs
@@ -1,3 +1,7 @@
+import argparse
+import contextlib
+import ctypes
+import errno
 import json
 import os
 import re
@@ -5,16 +9,51 @@ import shutil
 import stat
 import subprocess
 import sys
+import textwrap
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Any, Dict
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 import yarl
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore[assignment]
+    import msvcrt
+
+from dpybot_ext_mgr.cog_index import (
+    CogIndex,
+    build_index,
+    format_cog,
+    load_indexes,
+    write_indexes,
+)
+
 
 _current_folder = Path(__file__).absolute().parent
 REPOS_FOLDER = _current_folder / "repos"
 EXT_COGS_FOLDER = _current_folder.parent / "dpybot" / "ext_cogs"
 INSTALLED_COGS_JSON = _current_folder / "installed_cogs.json"
+STATE_LOCK_FILE = _current_folder / ".state.lock"
+REPO_INDEX_JSON = _current_folder / "repo_index.json"
+# bare repository whose objects are shared by all repositories cloned with it
+# as a reference, each repository's branches are kept in refs/repos/<name>/
+SHARED_OBJECTS_REPO = _current_folder / "shared_objects.git"
+CLONE_MODES = ("full", "shallow", "blobless")
+# manifests of installed cogs: {"commit": sha, "files": {relative_path: blob_sha}}
+MANIFESTS_FOLDER = EXT_COGS_FOLDER / ".manifests"
 
 
 def rmtree(path: Path) -> None:
@@ -37,8 +76,42 @@ def get_installed_cogs() -> Dict[str, str]:
 
 
 def write_installed_cogs(installed_cogs: Dict[str, str]) -> None:
-    with INSTALLED_COGS_JSON.open("w", encoding="utf-8") as fp:
-        return json.dump(installed_cogs, fp)
+    tmp_path = INSTALLED_COGS_JSON.with_name(f"{INSTALLED_COGS_JSON.name}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as fp:
+        json.dump(installed_cogs, fp)
+    os.replace(tmp_path, INSTALLED_COGS_JSON)
+
+
+@contextlib.contextmanager
+def state_transaction() -> Iterator[Dict[str, str]]:
+    """
+    Lock the manager's state and yield the installed cogs for modification.
+
+    Only one transaction can run at a time, other processes wait for the lock.
+    The installed cogs are written once, at the end of the transaction,
+    even if it failed midway, so that the file matches what's actually installed.
+    """
+    with STATE_LOCK_FILE.open("a") as lock_fp:
+        if fcntl is not None:
+            fcntl.flock(lock_fp.fileno(), fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(lock_fp.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            installed_cogs = get_installed_cogs()
+            try:
+                yield installed_cogs
+            finally:
+                write_installed_cogs(installed_cogs)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_fp.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_fp.seek(0)
+                msvcrt.locking(lock_fp.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class ExtMgrError(Exception):
+    pass
 
 
 def is_valid_repo_name(name: str) -> bool:
@@ -49,8 +122,16 @@ def is_valid_repo_name(name: str) -> bool:
     )
 
 
+def _find_cog_path(path: Path) -> Path:
+    # single-file cogs are `{name}.py` modules
+    file_path = path.with_name(f"{path.name}.py")
+    if not path.exists() and file_path.is_file():
+        return file_path
+    return path
+
+
 def get_installed_cog_path(name: str) -> Path:
-    return EXT_COGS_FOLDER / name
+    return _find_cog_path(EXT_COGS_FOLDER / name)
 
 
 def get_repo_path(name: str) -> Path:
@@ -58,32 +139,377 @@ def get_repo_path(name: str) -> Path:
 
 
 def get_cog_path(repo_name: str, cog_name: str) -> Path:
-    return REPOS_FOLDER / repo_name / cog_name
+    return _find_cog_path(REPOS_FOLDER / repo_name / cog_name)
+
+
+def get_repo_head(repo_name: str) -> str:
+    return subprocess.check_output(
+        ("git", "rev-parse", "HEAD"), cwd=str(get_repo_path(repo_name)), text=True
+    ).strip()
+
+
+def get_repo_index(repo_name: str) -> CogIndex:
+    """
+    Get the index of cogs in the repository.
 
+    The index is cached per commit and only rebuilt when the repository's HEAD moves.
+    """
+    head = get_repo_head(repo_name)
+    indexes = load_indexes(REPO_INDEX_JSON)
+    cached = indexes.get(repo_name)
+    if cached is not None and cached["head"] == head:
+        return cached["cogs"]
 
-def _update_repo(repo_path: Path) -> bool:
+    cogs = build_index(get_repo_path(repo_name))
+    indexes[repo_name] = {"head": head, "cogs": cogs}
+    write_indexes(REPO_INDEX_JSON, indexes)
+    return cogs
+
+
+def get_max_jobs() -> int:
+    return int(os.getenv("DPYBOT_EXT_MGR_JOBS") or min(8, (os.cpu_count() or 1) * 2))
+
+
+def get_git_timeout() -> Optional[float]:
+    value = os.getenv("DPYBOT_EXT_MGR_GIT_TIMEOUT") or "300"
+    return None if value.lower() == "none" else float(value)
+
+
+def get_clone_mode() -> str:
+    clone_mode = (os.getenv("DPYBOT_EXT_MGR_CLONE_MODE") or "full").lower()
+    if clone_mode not in CLONE_MODES:
+        raise ValueError(
+            "DPYBOT_EXT_MGR_CLONE_MODE needs to be one of: " + ", ".join(CLONE_MODES)
+        )
+    return clone_mode
+
+
+def use_shared_objects() -> bool:
+    value = os.getenv("DPYBOT_EXT_MGR_SHARED_OBJECTS") or "false"
+    return value.lower() in ("1", "true", "yes", "on")
+
+
+def _run_git(
+    args: Sequence[str], repo_path: Path, timeout: Optional[float]
+) -> Tuple[bool, str]:
+    # git can't ask for credentials when it runs in parallel with other commands
+    env = {**os.environ, "GIT_TERMINAL_PROMPT": "0"}
     try:
-        subprocess.check_call(("git", "fetch"), cwd=str(repo_path))
-    except subprocess.CalledProcessError as exc:
-        print(f"ERROR: git fetch returned exit code {exc.returncode}")
-        return False
+        process = subprocess.run(
+            ("git", *args),
+            cwd=str(repo_path),
+            env=env,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired as exc:
+        output = exc.output or ""
+        if isinstance(output, bytes):
+            output = output.decode(errors="replace")
+        return (
+            False,
+            f"{output}ERROR: git {args[0]} timed out after {timeout} seconds\n",
+        )
+    if process.returncode:
+        return False, (
+            f"{process.stdout}"
+            f"ERROR: git {args[0]} returned exit code {process.returncode}\n"
+        )
+    return True, process.stdout
+
+
+def is_shallow_repo(repo_path: Path) -> bool:
+    return (repo_path / ".git" / "shallow").exists()
+
+
+def _update_repo(repo_path: Path, timeout: Optional[float] = None) -> Tuple[bool, str]:
+    output = []
+    # shallow clones should stay shallow instead of fetching the whole history
+    fetch_args = ("fetch", "--depth", "1") if is_shallow_repo(repo_path) else ("fetch",)
+    for args in (fetch_args, ("reset", "--hard", "@{upstream}")):
+        success, command_output = _run_git(args, repo_path, timeout)
+        output.append(command_output)
+        if not success:
+            return False, "".join(output)
+
+    return True, "".join(output)
+
+
+def _update_repos(repo_names: Iterable[str]) -> Set[str]:
+    """
+    Update the given repositories in parallel.
+
+    Output of each repository is printed once its update finishes.
+    Returns names of the repositories that failed to update.
+    """
+    failed_repos = set()
+    timeout = get_git_timeout()
+    with ThreadPoolExecutor(max_workers=get_max_jobs()) as executor:
+        futures = {
+            executor.submit(_update_repo, get_repo_path(repo_name), timeout): repo_name
+            for repo_name in repo_names
+        }
+        for future in as_completed(futures):
+            repo_name = futures[future]
+            success, output = future.result()
+            if not success:
+                failed_repos.add(repo_name)
+            print(f"[{repo_name}] {'updated' if success else 'FAILED'}")
+            if output.strip():
+                print(textwrap.indent(output.rstrip(), "    "))
+    return failed_repos
+
+
+def get_manifest_path(cog_name: str) -> Path:
+    return MANIFESTS_FOLDER / f"{cog_name}.json"
+
+
+def get_manifest(cog_name: str) -> Optional[Dict[str, Any]]:
+    path = get_manifest_path(cog_name)
+    if not path.exists():
+        return None
+
+    with path.open(encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def write_manifest(cog_name: str, manifest: Dict[str, Any]) -> None:
+    MANIFESTS_FOLDER.mkdir(parents=True, exist_ok=True)
+    path = get_manifest_path(cog_name)
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as fp:
+        json.dump(manifest, fp, indent=4)
+    os.replace(tmp_path, path)
+
+
+def remove_manifest(cog_name: str) -> None:
+    get_manifest_path(cog_name).unlink(missing_ok=True)
 
+
+def _build_manifest(repo_name: str, cog_path_name: str) -> Dict[str, Any]:
+    """Build a manifest of the cog's files from the git tree of repo's HEAD."""
+    commit = get_repo_head(repo_name)
+    output = subprocess.check_output(
+        ("git", "ls-tree", "-r", "-z", commit, "--", cog_path_name),
+        cwd=str(get_repo_path(repo_name)),
+        text=True,
+    )
+    files = {}
+    for entry in output.split("\0"):
+        if not entry:
+            continue
+        info, path = entry.split("\t", 1)
+        _, object_type, object_sha = info.split()
+        # skip submodules
+        if object_type != "blob":
+            continue
+        # path relative to the cog's directory, empty for single-file cogs
+        files[path[len(cog_path_name) + 1 :]] = object_sha
+    return {"commit": commit, "files": files}
+
+
+def _load_renameat2() -> Optional[Callable[..., int]]:
+    if not sys.platform.startswith("linux"):
+        return None
     try:
-        subprocess.check_call(
-            ("git", "reset", "--hard", "@{upstream}"), cwd=str(repo_path)
+        renameat2 = ctypes.CDLL(None, use_errno=True).renameat2
+    except (OSError, AttributeError):
+        return None
+    renameat2.argtypes = (
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_int,
+        ctypes.c_char_p,
+        ctypes.c_uint,
+    )
+    return renameat2
+
+
+_renameat2 = _load_renameat2()
+_AT_FDCWD = -100
+_RENAME_EXCHANGE = 2
+
+
+def _exchange_paths(path: Path, other_path: Path) -> bool:
+    """
+    Atomically exchange the two paths.
+
+    Returns False if the platform or the filesystem doesn't support it.
+    """
+    if _renameat2 is None:
+        return False
+    if (
+        _renameat2(
+            _AT_FDCWD,
+            os.fsencode(path),
+            _AT_FDCWD,
+            os.fsencode(other_path),
+            _RENAME_EXCHANGE,
         )
-    except subprocess.CalledProcessError as exc:
-        print(f"ERROR: git reset returned exit code {exc.returncode}")
+        == 0
+    ):
+        return True
+    error = ctypes.get_errno()
+    if error in (errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP):
         return False
+    raise OSError(error, os.strerror(error), str(path), None, str(other_path))
 
-    return True
 
+def _install_cog(repo_name: str, cog_name: str) -> bool:
+    """
+    Install or update the cog from the repository.
+
+    Only files that changed since the last install are copied from the repository
+    and files deleted upstream are removed. The new version is assembled
+    in a staging directory so that the bot never sees a half-copied package.
+
+    An installed package is swapped with the staged one atomically where
+    the platform supports it (`renameat2()` with `RENAME_EXCHANGE` on Linux).
+    Elsewhere, it's first renamed to `.{cog_name}.old`, so there's a short window
+    in which the package doesn't exist. If the tool is interrupted in that window,
+    the old version is put back on the next install or update.
+
+    Returns whether anything changed.
+    """
+    cog_path = get_cog_path(repo_name, cog_name)
+    # `{cog_name}.py` for single-file cogs
+    target_path = EXT_COGS_FOLDER / cog_path.name
+    old_path = target_path.with_name(f".{cog_name}.old")
+    if old_path.exists():
+        if target_path.exists():
+            rmtree(old_path)
+        else:
+            os.rename(old_path, target_path)
+    manifest = _build_manifest(repo_name, cog_path.name)
+    old_manifest = get_manifest(cog_name)
+    old_files = old_manifest["files"] if old_manifest is not None else {}
+    if old_files == manifest["files"] and target_path.exists():
+        return False
+
+    staging_path = target_path.with_name(f".{cog_name}.staging")
+    if staging_path.is_dir():
+        rmtree(staging_path)
+    else:
+        staging_path.unlink(missing_ok=True)
 
-def _install_cog(cog_path: Path, target_path: Path) -> None:
     if cog_path.is_dir():
-        shutil.copytree(src=str(cog_path), dst=str(target_path), dirs_exist_ok=True)
+        staging_path.mkdir()
+        for rel_path, blob_sha in manifest["files"].items():
+            installed_file = target_path / rel_path
+            staged_file = staging_path / rel_path
+            staged_file.parent.mkdir(parents=True, exist_ok=True)
+            if old_files.get(rel_path) == blob_sha and installed_file.is_file():
+                # unchanged, hard links make this cheap without touching the file
+                # that's currently installed
+                try:
+                    os.link(installed_file, staged_file)
+                    continue
+                except OSError:
+                    pass
+            shutil.copy2(src=str(cog_path / rel_path), dst=str(staged_file))
+        # keep files the cog created at runtime, they were never in the manifest
+        if target_path.is_dir():
+            for installed_file in target_path.rglob("*"):
+                rel_path = installed_file.relative_to(target_path).as_posix()
+                if (
+                    rel_path in old_files
+                    or rel_path in manifest["files"]
+                    or "__pycache__" in installed_file.parts
+                    or not installed_file.is_file()
+                ):
+                    continue
+                staged_file = staging_path / rel_path
+                staged_file.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(src=str(installed_file), dst=str(staged_file))
+
+        if not target_path.exists():
+            os.rename(staging_path, target_path)
+        elif _exchange_paths(staging_path, target_path):
+            # the staging directory now holds the previous version
+            rmtree(staging_path)
+        else:
+            os.rename(target_path, old_path)
+            try:
+                os.rename(staging_path, target_path)
+            except BaseException:
+                os.rename(old_path, target_path)
+                raise
+            rmtree(old_path)
     else:
-        shutil.copy2(src=str(cog_path), dst=str(target_path))
+        shutil.copy2(src=str(cog_path), dst=str(staging_path))
+        os.replace(staging_path, target_path)
+
+    write_manifest(cog_name, manifest)
+    return True
+
+
+def _install_cogs(
+    installed_cogs: Dict[str, str], repo_name: str, cog_names: Sequence[str]
+) -> None:
+    if not get_repo_path(repo_name).exists():
+        raise ExtMgrError(f"Repository with name `{repo_name}` does not exist!")
+    # validate the whole batch before installing anything
+    repo_index = get_repo_index(repo_name)
+    for cog_name in cog_names:
+        if cog_name not in repo_index:
+            raise ExtMgrError(f"Cog with name `{cog_name}` does not exist!")
+        if cog_name in installed_cogs or get_installed_cog_path(cog_name).exists():
+            raise ExtMgrError(f"Cog with name `{cog_name}` is already installed!")
+
+    for cog_name in cog_names:
+        _install_cog(repo_name, cog_name)
+        installed_cogs[cog_name] = repo_name
+        print(f"Installed {cog_name}.")
+
+
+def _uninstall_cogs(installed_cogs: Dict[str, str], cog_names: Sequence[str]) -> None:
+    for cog_name in cog_names:
+        if not get_installed_cog_path(cog_name).exists():
+            raise ExtMgrError(f"Cog with name `{cog_name}` does not exist!")
+
+    for cog_name in cog_names:
+        cog_path = get_installed_cog_path(cog_name)
+        if cog_path.is_dir():
+            rmtree(cog_path)
+        else:
+            cog_path.unlink()
+        remove_manifest(cog_name)
+        installed_cogs.pop(cog_name, None)
+        print(f"Uninstalled {cog_name}.")
+
+
+def _update_cogs(
+    installed_cogs: Dict[str, str], cog_names: Optional[Sequence[str]] = None
+) -> bool:
+    if cog_names is None:
+        cog_names = list(installed_cogs)
+    for cog_name in cog_names:
+        if cog_name not in installed_cogs:
+            raise ExtMgrError(f"Cog with name `{cog_name}` is not installed!")
+
+    failed_repos = _update_repos({installed_cogs[cog_name] for cog_name in cog_names})
+    updated_cogs = []
+    for cog_name in cog_names:
+        repo_name = installed_cogs[cog_name]
+        if repo_name in failed_repos:
+            continue
+        if _install_cog(repo_name, cog_name):
+            updated_cogs.append(cog_name)
+    if updated_cogs:
+        print(
+            "Updated cogs (reload them in the bot to apply the changes): "
+            + ", ".join(updated_cogs)
+        )
+    else:
+        print("All installed cogs are up to date.")
+    if failed_repos:
+        print(
+            "Some repositories (and cogs installed from them) failed to update: "
+            + ", ".join(sorted(failed_repos))
+        )
+    return not failed_repos
 
 
 def install_cog() -> None:
@@ -94,61 +520,55 @@ def install_cog() -> None:
         return
     print("Enter cog name:")
     cog_name = input("> ").strip()
-    cog_path = get_cog_path(repo_name, cog_name)
-    if not cog_path.exists():
-        print("ERROR: Cog with this name does not exist!")
-        return
-
-    target_path = get_installed_cog_path(cog_name)
-    if target_path.exists():
-        print("ERROR: Cog with this name is already installed!")
-        return
-
-    installed_cogs = get_installed_cogs()
-    installed_cogs[cog_name] = repo_name
-    _install_cog(cog_path, target_path)
-    write_installed_cogs(installed_cogs)
+    with state_transaction() as installed_cogs:
+        try:
+            _install_cogs(installed_cogs, repo_name, [cog_name])
+        except ExtMgrError as exc:
+            print(f"ERROR: {exc}")
 
 
 def uninstall_cog() -> None:
     print("Enter cog name:")
     cog_name = input("> ").strip()
-    cog_path = get_installed_cog_path(cog_name)
-    if cog_path.exists():
-        installed_cogs = get_installed_cogs()
-        installed_cogs.pop(cog_name, None)
-        rmtree(cog_path)
-        write_installed_cogs(installed_cogs)
-    else:
-        print("ERROR: Cog with this name does not exist!")
+    with state_transaction() as installed_cogs:
+        try:
+            _uninstall_cogs(installed_cogs, [cog_name])
+        except ExtMgrError as exc:
+            print(f"ERROR: {exc}")
 
 
 def update_cogs() -> None:
-    updated_repos = set()
-    failed_repos = set()
-    for cog_name, repo_name in get_installed_cogs().items():
-        if repo_name not in updated_repos and repo_name not in failed_repos:
-            if _update_repo(get_repo_path(repo_name)):
-                updated_repos.add(repo_name)
-            else:
-                failed_repos.add(repo_name)
-                continue
-        _install_cog(
-            get_cog_path(repo_name, cog_name), get_installed_cog_path(cog_name)
-        )
-    if failed_repos:
-        print(
-            "Some repositories (and cogs installed from them) failed to update: "
-            + ", ".join(failed_repos)
-        )
+    with state_transaction() as installed_cogs:
+        _update_cogs(installed_cogs)
 
 
 def list_cogs_in_repo() -> None:
     print("Enter repository name:")
     repo_name = input("> ").strip()
-    repo_path = get_repo_path(repo_name)
-    for path in repo_path.iterdir():
-        print(f"- {path.stem}")
+    if not get_repo_path(repo_name).exists():
+        print("ERROR: Repository with this name does not exist!")
+        return
+    for cog_name, info in get_repo_index(repo_name).items():
+        print(format_cog(cog_name, info))
+
+
+def _search_cogs(query: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+    query = query.casefold()
+    results = []
+    for repo_path in sorted(REPOS_FOLDER.iterdir()):
+        if not repo_path.is_dir():
+            continue
+        for cog_name, info in get_repo_index(repo_path.name).items():
+            if query in cog_name.casefold() or query in info["description"].casefold():
+                results.append((repo_path.name, cog_name, info))
+    return results
+
+
+def search_cogs() -> None:
+    print("Enter search query:")
+    query = input("> ").strip()
+    for repo_name, cog_name, info in _search_cogs(query):
+        print(format_cog(f"{repo_name}/{cog_name}", info))
 
 
 def list_repositories() -> None:
@@ -159,16 +579,69 @@ def list_repositories() -> None:
 
 
 def update_repositories() -> None:
-    for repo_path in REPOS_FOLDER.iterdir():
-        if not repo_path.is_dir():
-            continue
-        _update_repo(repo_path)
+    failed_repos = _update_repos(
+        repo_path.name for repo_path in REPOS_FOLDER.iterdir() if repo_path.is_dir()
+    )
+    if failed_repos:
+        print("Some repositories failed to update: " + ", ".join(sorted(failed_repos)))
 
 
-def add_repository() -> None:
-    print("Enter repository address:")
-    url = input("> ").strip()
-    repo_name: str = ""
+def _fetch_into_shared_objects(url: str, repo_name: str) -> None:
+    if not SHARED_OBJECTS_REPO.exists():
+        subprocess.check_call(
+            ("git", "init", "--quiet", "--bare", str(SHARED_OBJECTS_REPO))
+        )
+    subprocess.check_call(
+        (
+            "git",
+            "fetch",
+            "--no-tags",
+            url,
+            f"+refs/heads/*:refs/repos/{repo_name}/*",
+        ),
+        cwd=str(SHARED_OBJECTS_REPO),
+    )
+
+
+def _remove_from_shared_objects(repo_name: str) -> None:
+    if not SHARED_OBJECTS_REPO.exists():
+        return
+    refs = subprocess.check_output(
+        ("git", "for-each-ref", "--format=%(refname)", f"refs/repos/{repo_name}/"),
+        cwd=str(SHARED_OBJECTS_REPO),
+        text=True,
+    ).split()
+    # the objects themselves are only removed by `gc`
+    for ref in refs:
+        subprocess.check_call(
+            ("git", "update-ref", "-d", ref), cwd=str(SHARED_OBJECTS_REPO)
+        )
+
+
+def _clone_repo(url: str, repo_name: str) -> None:
+    clone_mode = get_clone_mode()
+    args = ["git", "clone"]
+    if clone_mode == "shallow":
+        args.extend(("--depth", "1"))
+    elif clone_mode == "blobless":
+        args.append("--filter=blob:none")
+
+    if use_shared_objects():
+        if clone_mode == "full":
+            # objects already in the shared repository (e.g. from another fork
+            # of the same repository) are not downloaded or stored again
+            _fetch_into_shared_objects(url, repo_name)
+            args.extend(("--reference", str(SHARED_OBJECTS_REPO)))
+        else:
+            # git can't borrow objects from a shallow repository and a partial
+            # clone fetches missing blobs from its remote, not from the reference
+            print(f"Shared objects are not used with {clone_mode} clones.")
+
+    args.extend((url, str(get_repo_path(repo_name))))
+    subprocess.check_call(args)
+
+
+def _get_repo_name_from_url(url: str) -> str:
     for part in reversed(yarl.URL(url).parts):
         if not part or part == "/":
             continue
@@ -176,36 +649,123 @@ def add_repository() -> None:
             break
         if get_repo_path(part).exists():
             break
-        repo_name = part
-        break
+        return part
+    return ""
 
-    if not repo_name:
-        print("Couldn't automatically determine repository name.")
-        while True:
-            print("Enter repository name:")
-            repo_name = input("> ").strip()
-            if not is_valid_repo_name(repo_name):
-                print(
-                    "ERROR: Repo names can only contain characters A-z, numbers,"
-                    " underscores, hyphens, and dots."
-                )
-            if get_repo_path(repo_name).exists():
-                print("ERROR: This name is already taken!")
-            break
+
+def _add_repository(url: str, repo_name: str) -> None:
+    if not is_valid_repo_name(repo_name):
+        raise ExtMgrError(
+            "Repo names can only contain characters A-z, numbers,"
+            " underscores, hyphens, and dots."
+        )
+    if get_repo_path(repo_name).exists():
+        raise ExtMgrError(f"Repository name `{repo_name}` is already taken!")
     try:
-        subprocess.check_call(("git", "clone", url, str(get_repo_path(repo_name))))
+        _clone_repo(url, repo_name)
     except subprocess.CalledProcessError as exc:
-        print(f"ERROR: git clone returned exit code {exc.returncode}")
+        raise ExtMgrError(
+            f"git {exc.cmd[1]} returned exit code {exc.returncode}"
+        ) from None
+    print(f"Found {len(get_repo_index(repo_name))} cog(s) in the repository.")
+
+
+def _remove_repository(repo_name: str) -> None:
+    repo_path = get_repo_path(repo_name)
+    if not repo_path.exists():
+        raise ExtMgrError(f"Repository with name `{repo_name}` does not exist!")
+    rmtree(repo_path)
+    _remove_from_shared_objects(repo_name)
+    indexes = load_indexes(REPO_INDEX_JSON)
+    if indexes.pop(repo_name, None) is not None:
+        write_indexes(REPO_INDEX_JSON, indexes)
+
+
+def add_repository() -> None:
+    print("Enter repository address:")
+    url = input("> ").strip()
+    repo_name = _get_repo_name_from_url(url)
+
+    if not repo_name:
+        print("Couldn't automatically determine repository name.")
+        print("Enter repository name:")
+        repo_name = input("> ").strip()
+    with state_transaction():
+        try:
+            _add_repository(url, repo_name)
+        except ExtMgrError as exc:
+            print(f"ERROR: {exc}")
 
 
 def remove_repository() -> None:
     print("Enter repository name:")
     repo_name = input("> ").strip()
-    repo_path = get_repo_path(repo_name)
-    if repo_path.exists():
-        rmtree(repo_path)
-    else:
-        print("ERROR: Repository with this name does not exist!")
+    with state_transaction():
+        try:
+            _remove_repository(repo_name)
+        except ExtMgrError as exc:
+            print(f"ERROR: {exc}")
+
+
+def _gc_repo(repo_path: Path, timeout: Optional[float] = None) -> Tuple[bool, str]:
+    output = []
+    for args in (
+        ("reflog", "expire", "--expire=now", "--all"),
+        ("gc", "--prune=now", "--quiet"),
+    ):
+        success, command_output = _run_git(args, repo_path, timeout)
+        output.append(command_output)
+        if not success:
+            return False, "".join(output)
+
+    return True, "".join(output)
+
+
+def _get_size(path: Path) -> int:
+    return sum(
+        file_path.lstat().st_size
+        for file_path in path.rglob("*")
+        if file_path.is_file()
+    )
+
+
+def gc_repositories() -> None:
+    repo_paths = [
+        repo_path for repo_path in REPOS_FOLDER.iterdir() if repo_path.is_dir()
+    ]
+    if SHARED_OBJECTS_REPO.exists():
+        # refs of repositories removed by other means than `remove_repository()`
+        repo_names = {repo_path.name for repo_path in repo_paths}
+        refs = subprocess.check_output(
+            ("git", "for-each-ref", "--format=%(refname)", "refs/repos/"),
+            cwd=str(SHARED_OBJECTS_REPO),
+            text=True,
+        ).split()
+        for repo_name in {ref.split("/")[2] for ref in refs} - repo_names:
+            _remove_from_shared_objects(repo_name)
+        repo_paths.append(SHARED_OBJECTS_REPO)
+
+    size_before = sum(_get_size(repo_path) for repo_path in repo_paths)
+    timeout = get_git_timeout()
+    failed_repos = set()
+    with ThreadPoolExecutor(max_workers=get_max_jobs()) as executor:
+        futures = {
+            executor.submit(_gc_repo, repo_path, timeout): repo_path.name
+            for repo_path in repo_paths
+        }
+        for future in as_completed(futures):
+            success, output = future.result()
+            if not success:
+                failed_repos.add(futures[future])
+                print(f"[{futures[future]}] FAILED")
+                print(textwrap.indent(output.rstrip(), "    "))
+    size_after = sum(_get_size(repo_path) for repo_path in repo_paths)
+    print(
+        f"Repositories now take {size_after / 1024**2:.1f} MiB"
+        f" (before gc: {size_before / 1024**2:.1f} MiB)."
+    )
+    if failed_repos:
+        print("Some repositories failed to gc: " + ", ".join(sorted(failed_repos)))
 
 
 ACTIONS = [
@@ -218,6 +778,8 @@ ACTIONS = [
     update_repositories,
     add_repository,
     remove_repository,
+    search_cogs,
+    gc_repositories,
 ]
 
 
@@ -233,6 +795,8 @@ def main_menu() -> None:
             "6. Update repositories.\n"
             "7. Add a repository.\n"
             "8. Remove a repository.\n"
+            "9. Search cogs.\n"
+            "10. Clean up repositories (gc).\n"
             "0. Exit."
         )
         choice = input("> ").strip()
@@ -243,8 +807,158 @@ def main_menu() -> None:
         func()
 
 
+def _get_installed_cogs_info(installed_cogs: Dict[str, str]) -> Dict[str, Any]:
+    info = {}
+    for cog_name, repo_name in installed_cogs.items():
+        manifest = get_manifest(cog_name)
+        info[cog_name] = {
+            "repo": repo_name,
+            "commit": manifest["commit"] if manifest is not None else None,
+        }
+    return info
+
+
+def _print_json(data: Any) -> None:
+    print(json.dumps(data, indent=4))
+
+
+def parse_cli_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog="python -m dpybot_ext_mgr",
+        description="Manage repositories and cogs installed from them."
+        " Starts an interactive menu when no command is given.",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+
+    install = subparsers.add_parser("install", help="Install cogs from a repository.")
+    install.add_argument("cogs", nargs="+", metavar="cog")
+    install.add_argument("--repo", required=True, help="Repository to install from.")
+
+    uninstall = subparsers.add_parser("uninstall", help="Uninstall cogs.")
+    uninstall.add_argument("cogs", nargs="+", metavar="cog")
+
+    update = subparsers.add_parser("update", help="Update installed cogs.")
+    update.add_argument("cogs", nargs="*", metavar="cog")
+    update.add_argument("--all", action="store_true", help="Update all cogs.")
+
+    list_cmd = subparsers.add_parser(
+        "list", help="List installed cogs or cogs available in a repository."
+    )
+    list_cmd.add_argument("--repo", help="List cogs available in this repository.")
+    list_cmd.add_argument("--json", action="store_true", help="Output JSON.")
+
+    search = subparsers.add_parser("search", help="Search cogs in all repositories.")
+    search.add_argument("query")
+    search.add_argument("--json", action="store_true", help="Output JSON.")
+
+    add_repo = subparsers.add_parser("add-repo", help="Add a repository.")
+    add_repo.add_argument("url")
+    add_repo.add_argument("--name", help="Name of the repository.")
+
+    remove_repo = subparsers.add_parser("remove-repo", help="Remove repositories.")
+    remove_repo.add_argument("repos", nargs="+", metavar="repo")
+
+    list_repos = subparsers.add_parser("list-repos", help="List repositories.")
+    list_repos.add_argument("--json", action="store_true", help="Output JSON.")
+
+    subparsers.add_parser("update-repos", help="Update all repositories.")
+    subparsers.add_parser("gc", help="Clean up repositories.")
+
+    args = parser.parse_args(argv)
+    if args.command == "update" and args.all == bool(args.cogs):
+        parser.error("update requires either --all or names of cogs to update")
+    return args
+
+
+def run_cli(args: argparse.Namespace) -> int:
+    if args.command == "list":
+        if args.repo is not None:
+            if not get_repo_path(args.repo).exists():
+                raise ExtMgrError(f"Repository with name `{args.repo}` does not exist!")
+            repo_index = get_repo_index(args.repo)
+            if args.json:
+                _print_json(repo_index)
+            else:
+                for cog_name, info in repo_index.items():
+                    print(format_cog(cog_name, info))
+        else:
+            installed_cogs_info = _get_installed_cogs_info(get_installed_cogs())
+            if args.json:
+                _print_json(installed_cogs_info)
+            else:
+                for cog_name, info in installed_cogs_info.items():
+                    print(f"- {cog_name} (from {info['repo']})")
+        return 0
+    if args.command == "search":
+        results = _search_cogs(args.query)
+        if args.json:
+            _print_json(
+                [
+                    {"repo": repo_name, "name": cog_name, **info}
+                    for repo_name, cog_name, info in results
+                ]
+            )
+        else:
+            for repo_name, cog_name, info in results:
+                print(format_cog(f"{repo_name}/{cog_name}", info))
+        return 0
+    if args.command == "list-repos":
+        repo_names = sorted(
+            repo_path.name for repo_path in REPOS_FOLDER.iterdir() if repo_path.is_dir()
+        )
+        if args.json:
+            _print_json(
+                [
+                    {"name": repo_name, "head": get_repo_head(repo_name)}
+                    for repo_name in repo_names
+                ]
+            )
+        else:
+            for repo_name in repo_names:
+                print(f"- {repo_name}")
+        return 0
+
+    # everything else modifies the state and runs as a single transaction
+    with state_transaction() as installed_cogs:
+        if args.command == "install":
+            _install_cogs(installed_cogs, args.repo, args.cogs)
+        elif args.command == "uninstall":
+            _uninstall_cogs(installed_cogs, args.cogs)
+        elif args.command == "update":
+            if not _update_cogs(installed_cogs, None if args.all else args.cogs):
+                return 1
+        elif args.command == "add-repo":
+            repo_name = args.name or _get_repo_name_from_url(args.url)
+            if not repo_name:
+                raise ExtMgrError(
+                    "Couldn't automatically determine repository name,"
+                    " pass it with --name."
+                )
+            _add_repository(args.url, repo_name)
+        elif args.command == "remove-repo":
+            for repo_name in args.repos:
+                _remove_repository(repo_name)
+        elif args.command == "update-repos":
+            update_repositories()
+        elif args.command == "gc":
+            gc_repositories()
+    return 0
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_cli_args(argv)
+    if args.command is None:
+        main_menu()
+        return 0
+    try:
+        return run_cli(args)
+    except ExtMgrError as exc:
+        print(f"ERROR: {exc}", file=sys.stderr)
+        return 1
+
+
 if __name__ == "__main__":
     try:
-        main_menu()
+        sys.exit(main())
     except KeyboardInterrupt:
         print("Ctrl+C received, exiting...")
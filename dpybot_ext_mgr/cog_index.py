@@ -0,0 +1,162 @@
+import ast
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# cog_name: {"description": str, "required_intents": [...], "dependencies": [...]}
+CogIndex = Dict[str, Dict[str, Any]]
+
+_INTENTS_PRESETS = ("all", "default", "none")
+
+
+def _is_intents(node: ast.expr) -> bool:
+    # `Intents` or `discord.Intents`
+    return (isinstance(node, ast.Name) and node.id == "Intents") or (
+        isinstance(node, ast.Attribute) and node.attr == "Intents"
+    )
+
+
+def _parse_intents(node: ast.expr) -> List[str]:
+    """
+    Get intent names from a statically parsed `REQUIRED_INTENTS` value.
+
+    Supports `discord.Intents(name=True, ...)` and the presets
+    (e.g. `discord.Intents.default()`). Anything else can't be determined
+    without running the code so it's kept as the source code of the expression.
+    """
+    if isinstance(node, ast.Call):
+        if _is_intents(node.func) and not node.args:
+            names = []
+            for keyword in node.keywords:
+                if keyword.arg is None:
+                    break
+                if not isinstance(keyword.value, ast.Constant):
+                    break
+                if keyword.value.value is True:
+                    names.append(keyword.arg)
+            else:
+                return names
+        elif (
+            isinstance(node.func, ast.Attribute)
+            and _is_intents(node.func.value)
+            and node.func.attr in _INTENTS_PRESETS
+            and not node.args
+            and not node.keywords
+        ):
+            return [node.func.attr]
+    return [ast.unparse(node)]
+
+
+def _parse_dependencies(node: ast.expr) -> List[str]:
+    try:
+        value = ast.literal_eval(node)
+    except (ValueError, TypeError, SyntaxError):
+        return [ast.unparse(node)]
+    if isinstance(value, str):
+        return [value]
+    if not isinstance(value, (list, tuple, set, frozenset)):
+        return [ast.unparse(node)]
+    return [str(item) for item in value]
+
+
+def parse_cog(path: Path) -> Optional[Dict[str, Any]]:
+    """
+    Get metadata of the cog at the given path without importing it.
+
+    The path can be either a package or a single-file module.
+    Returns None if the path isn't a cog, i.e. a package or module with `setup()`.
+    """
+    if path.is_dir():
+        module_file = path / "__init__.py"
+    elif path.suffix == ".py":
+        module_file = path
+    else:
+        return None
+    if not module_file.is_file():
+        return None
+    try:
+        tree = ast.parse(module_file.read_bytes(), filename=str(module_file))
+    except SyntaxError:
+        return None
+
+    has_setup = False
+    required_intents: List[str] = []
+    dependencies: List[str] = []
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            if node.name == "setup":
+                has_setup = True
+            continue
+        if isinstance(node, ast.ImportFrom):
+            # `from .core import setup`
+            if any((alias.asname or alias.name) == "setup" for alias in node.names):
+                has_setup = True
+            continue
+
+        value: Optional[ast.expr] = None
+        targets: List[ast.expr] = []
+        if isinstance(node, ast.Assign):
+            value = node.value
+            targets = node.targets
+        elif isinstance(node, ast.AnnAssign) and node.value is not None:
+            value = node.value
+            targets = [node.target]
+        for target in targets:
+            if not isinstance(target, ast.Name) or value is None:
+                continue
+            if target.id == "REQUIRED_INTENTS":
+                required_intents = _parse_intents(value)
+            elif target.id == "DEPENDENCIES":
+                dependencies = _parse_dependencies(value)
+
+    if not has_setup:
+        return None
+    docstring = ast.get_docstring(tree) or ""
+    return {
+        "description": docstring.strip().splitlines()[0] if docstring.strip() else "",
+        "required_intents": required_intents,
+        "dependencies": dependencies,
+    }
+
+
+def build_index(repo_path: Path) -> CogIndex:
+    index = {}
+    for path in sorted(repo_path.iterdir()):
+        if path.name.startswith((".", "_")):
+            continue
+        # single-file cogs are indexed under their module name
+        name = path.name if path.is_dir() else path.stem
+        if name in index:
+            continue
+        info = parse_cog(path)
+        if info is not None:
+            index[name] = info
+    return index
+
+
+def load_indexes(path: Path) -> Dict[str, Dict[str, Any]]:
+    # repo_name: {"head": sha, "cogs": CogIndex}
+    if not path.exists():
+        return {}
+
+    with path.open(encoding="utf-8") as fp:
+        return json.load(fp)
+
+
+def write_indexes(path: Path, indexes: Dict[str, Dict[str, Any]]) -> None:
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("w", encoding="utf-8") as fp:
+        json.dump(indexes, fp, indent=4)
+    os.replace(tmp_path, path)
+
+
+def format_cog(name: str, info: Dict[str, Any]) -> str:
+    lines = [f"- {name}" + (f": {info['description']}" if info["description"] else "")]
+    extras: List[str] = []
+    if info["required_intents"]:
+        extras.append("required intents: " + ", ".join(info["required_intents"]))
+    if info["dependencies"]:
+        extras.append("dependencies: " + ", ".join(info["dependencies"]))
+    lines.extend(f"    {extra}" for extra in extras)
+    return "\n".join(lines)